@@ -1,12 +1,14 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
-import pandas as pd
 import datetime as dt
-from categorical_yearplot import cyearplot
-from covers_dataset import CoversDataset, get_file_path_date, get_file_path_newspaper
-from utils import LabelClass, Clubs, Newspaper
+import hashlib
+import os
+from annotation_store import AnnotationStore, ARRAYS, flatten_parsed_labels
+from cover_metrics import cover_metrics, pack_label_masks, unpack_label_masks, MAX_AREA_TOL
+from cover_cube import CoverCube, COVERS
+from next_day import next_day_table
+from covers_dataset import CoversDataset, get_file_path_date, get_file_path_newspaper, get_file_path_newspaper_and_date, parse_label_files
+from utils import Clubs, Newspaper, files_fingerprint
 
 PT_MONTH_LABELS = [
     'Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out',
@@ -14,6 +16,37 @@ PT_MONTH_LABELS = [
 ]
 PT_DAY_LABELS = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sab', 'Dom']
 
+# Plotting parameters of each view, also part of the key of the rendered
+# figures in render_cache.py
+CALENDAR_STYLE = {
+    'colors': {c.id: c.color
+               for c in Clubs},
+    'daylabels': PT_DAY_LABELS,
+    'monthlabels': PT_MONTH_LABELS,
+    'linewidth': 2,
+    'figwidth': 10,
+    'figheight_per_newspaper': 10 / 3,
+}
+MONTH_STYLE = {
+    'colors': ['red', 'blue', 'green'],
+    'monthlabels': PT_MONTH_LABELS,
+    'linewidth': 2,
+    'figwidth_per_newspaper': 23 / 3,
+    'figheight': 7,
+}
+
+COVERS_CACHE_VERSION = 2
+GAMES_CACHE_VERSION = 2
+
+GAMES_DATA_DTYPES = {
+    'date': str,
+    'home_team': str,
+    'away_team': str,
+    # Nullable: fixtures not played yet have blank scores
+    'home_score': 'Int16',
+    'away_score': 'Int16',
+}
+
 
 def filter_newspapers(df, newspapers):
     return df[df["Newspaper"].isin(newspapers)]
@@ -37,101 +70,253 @@ def filter_df_game_data_by_team_and_result(game_data_df, cond_team, cond_result)
 
 
 def produce_cover_counts(df):
-    counts = np.zeros(len(LabelClass))
-    for index, row in df.iterrows():
-        counts[list(row['Highlighted_Labels'])] += 1
-
+    counts = unpack_label_masks(df['Highlighted_Mask']).sum(axis=0)
     return counts[Clubs.ids()]
 
 
-def cover_data_to_pandas():
-    MAX_AREA_TOL = .3
-    df = []
-
-    dataset = CoversDataset('./data/')
-    for i in range(len(dataset)):
-        _, target = dataset[i]
-        image_path = dataset.images[i]
-        date = get_file_path_date(image_path)
-
-        newspaper_name = get_file_path_newspaper(image_path).lower()
-        areas = target['area']
+def cover_data_to_pandas(root='./data/',
+                         use_store=True,
+                         workers=1,
+                         max_area_tol=MAX_AREA_TOL):
+    # Only the labels are needed, so the cover images are never decoded
+    if use_store:
+        store = AnnotationStore.open(root, workers=workers)
+        names = store.names
+        arrays = {name: getattr(store, name) for name in ARRAYS}
+    else:
+        label_paths = CoversDataset(root, load_images=False).labels
+        names = [get_file_path_newspaper_and_date(p) for p in label_paths]
+        arrays = flatten_parsed_labels(parse_label_files(label_paths, workers))
+
+    return covers_frame(names, arrays, max_area_tol).reset_index(drop=True)
+
+
+def covers_frame(names, arrays, max_area_tol=MAX_AREA_TOL):
+    """
+    Builds the covers frame, indexed by label file name, from the flat box
+    arrays of the label files with the given names (<newspaper>_<date>).
+    The highlighted labels of each cover are stored as a uint8 bitmask in
+    Highlighted_Mask (see cover_metrics.pack_label_masks).
+    """
+    metrics = cover_metrics(arrays, max_area_tol)
+
+    # Some newspapers dont publish on holidays. Skip those
+    keep = np.flatnonzero(metrics['has_boxes'])
+    names = [names[i] for i in keep]
+    highlighted = metrics['highlighted'][keep]
+
+    df = pd.DataFrame({
+        'Date':
+        pd.to_datetime([get_file_path_date(n) for n in names],
+                       format='%Y-%m-%d'),
+        'Newspaper': [get_file_path_newspaper(n).lower() for n in names],
+        'Highlighted_Mask': pack_label_masks(highlighted),
+    }, index=pd.Index(names, name='Label'))
+    return df
 
-        # Some newspapers dont publish on holidays. Skip those
-        if len(areas) == 0:
-            continue
 
-        labels = target['labels']
+def _file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
 
-        benfica_areas = areas[labels == LabelClass.BENFICA.id]
-        porto_areas = areas[labels == LabelClass.PORTO.id]
-        sporting_areas = areas[labels == LabelClass.SPORTING.id]
-        other_areas = areas[labels == LabelClass.OTHER.id]
-        cover_total_area = target['image_width'] * target['image_height']
 
-        max_area = np.max(target['area'])
-        max_coverage_labels = tuple(
-            np.unique(labels[np.isclose(areas,
-                                        max_area,
-                                        atol=0,
-                                        rtol=MAX_AREA_TOL)]))
+def update_covers_df(root='./data/',
+                     cache_path=None,
+                     workers=1,
+                     info=None,
+                     cube_path=None):
+    """
+    Incremental version of cover_data_to_pandas.
 
-        df.append({
-            'Date': dt.datetime.strptime(date, '%Y-%m-%d'),
-            'Newspaper': newspaper_name,
-            'Highlighted_Labels': max_coverage_labels,
-        })
+    The cache keeps the covers frame (indexed by label file name) and a
+    manifest with the mtime, size and hash of every label file it was built
+    from. Only the label files that were added, changed or deleted since
+    the last run are parsed, and their rows are patched into the frame.
+    The CoverCube of the frame is saved next to it, in cube_path.
 
-    df = pd.DataFrame(df)
-    return df
+    If given, the info dict is filled with the cache outcome ('hit',
+    'partial' or 'miss') and the number of parsed and deleted files.
+    """
+    if info is None:
+        info = {}
+    if cache_path is None:
+        cache_path = os.path.join(root, 'covers_df.pkl')
+    if cube_path is None:
+        cube_path = os.path.join(root, 'covers_cube.npz')
 
+    try:
+        cache = pd.read_pickle(cache_path)
+        if not isinstance(cache, dict) or cache.get(
+                'version') != COVERS_CACHE_VERSION:
+            raise ValueError('Outdated covers cache')
+        manifest, frame = cache['manifest'], cache['frame']
+    except (FileNotFoundError, ValueError):
+        manifest, frame = {}, None
+
+    # Stat every label file. Hashes are only computed when the stat differs
+    # from the manifest, so that touched but unchanged files are not parsed.
+    labels_dir = os.path.join(root, 'labels')
+    stats = {}
+    with os.scandir(labels_dir) as entries:
+        for entry in entries:
+            name, ext = os.path.splitext(entry.name)
+            if ext == '.xml':
+                st = entry.stat()
+                stats[name] = (st.st_mtime_ns, st.st_size)
+
+    deleted = [name for name in manifest if name not in stats]
+    changed = []
+    dirty = frame is None or len(deleted) > 0
+    for name, stat in stats.items():
+        file_entry = manifest.get(name)
+        if file_entry is not None and file_entry['stat'] == stat:
+            continue
 
-def games_data_to_pandas():
-    min_date = dt.datetime(year=2019, month=1, day=1)
-    max_date = dt.datetime(year=2019, month=12, day=31)
-    import csv
-    df = []
-    with open('./data/games_data.csv', 'r') as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-        for line_count, row in enumerate(csv_reader):
-            date = dt.datetime.strptime(row['date'], '%Y-%m-%d')
-            if date < min_date or date > max_date:
-                continue
-            df.append({
-                'Date': date,
-                'Home_Team': row['home_team'],
-                'Away_Team': row['away_team'],
-                'Home_Score': row['home_score'],
-                'Away_Score': row['away_score']
-            })
-
-    df = pd.DataFrame(df)
+        dirty = True
+        sha1 = _file_sha1(os.path.join(labels_dir, name + '.xml'))
+        if file_entry is None or file_entry['sha1'] != sha1:
+            changed.append(name)
+            file_entry = {'rows': 0}
+        manifest[name] = {'stat': stat, 'sha1': sha1, 'rows': file_entry['rows']}
+
+    info['cache'] = 'miss' if frame is None else 'partial' if dirty else 'hit'
+    info['parsed_files'] = len(changed)
+    info['deleted_files'] = len(deleted)
+    if not dirty:
+        frame = frame.reset_index(drop=True)
+        if not os.path.exists(cube_path):
+            CoverCube.from_covers_df(frame).save(cube_path)
+        return frame
+
+    # Parse the changed files and patch their rows into the frame
+    label_paths = [os.path.join(labels_dir, n + '.xml') for n in changed]
+    arrays = flatten_parsed_labels(parse_label_files(label_paths, workers))
+    info['parsed_boxes'] = len(arrays['labels'])
+    new_frame = covers_frame(changed, arrays)
+    for name in changed:
+        manifest[name]['rows'] = int(name in new_frame.index)
+    for name in deleted:
+        del manifest[name]
+
+    if frame is None:
+        frame = new_frame
+    else:
+        frame = frame.drop(index=deleted + changed, errors='ignore')
+        if len(new_frame) > 0:
+            frame = pd.concat([frame, new_frame])
+    # Same order as the files of CoversDataset
+    frame = frame.sort_index(ascending=False)
+
+    # Saved before the frame: if interrupted in between, the next run finds
+    # the old frame outdated and saves both again.
+    CoverCube.from_covers_df(frame).save(cube_path)
+    pd.to_pickle(
+        {
+            'version': COVERS_CACHE_VERSION,
+            'manifest': manifest,
+            'frame': frame
+        }, cache_path)
+    return frame.reset_index(drop=True)
+
+
+def games_data_to_pandas(path='./data/games_data.csv',
+                         start=dt.date(2019, 1, 1),
+                         end=dt.date(2019, 12, 31),
+                         chunksize=100000):
+    """
+    Loads the games played between start and end (inclusive, either may be
+    None for no bound; dates, datetimes or Timestamps). Scores are
+    integers, dates datetime64 and the team names categorical. Games
+    without a score (not played yet) are skipped.
+
+    The file is read in chunks and the date range is applied to each chunk
+    before the dates are parsed, so only the selected games are kept in
+    memory.
+    """
+    # Compared with the raw ISO dates of the file, without the time
+    if start is not None:
+        start = pd.Timestamp(start).date().isoformat()
+    if end is not None:
+        end = pd.Timestamp(end).date().isoformat()
+
+    chunks = []
+    for chunk in pd.read_csv(path,
+                             usecols=list(GAMES_DATA_DTYPES),
+                             dtype=GAMES_DATA_DTYPES,
+                             chunksize=chunksize):
+        # ISO dates sort like the dates themselves
+        keep = (chunk['home_score'].notna() &
+                chunk['away_score'].notna()).to_numpy(dtype=bool, copy=True)
+        if start is not None:
+            keep &= (chunk['date'] >= start).values
+        if end is not None:
+            keep &= (chunk['date'] <= end).values
+        chunks.append(chunk[keep])
+
+    df = pd.concat(chunks, ignore_index=True)
+    teams = pd.unique(pd.concat([df['home_team'], df['away_team']]))
+    df = pd.DataFrame({
+        'Date':
+        pd.to_datetime(df['date'], format='%Y-%m-%d'),
+        'Home_Team':
+        pd.Categorical(df['home_team'], categories=teams),
+        'Away_Team':
+        pd.Categorical(df['away_team'], categories=teams),
+        'Home_Score':
+        df['home_score'].astype(np.int16),
+        'Away_Score':
+        df['away_score'].astype(np.int16),
+    })
     df = df.drop_duplicates()  # paranoid cleanup
 
     return df
 
 
-def year_calendar_plot(covers_df):
+def filter_years(df, years):
+    if years is None:
+        return df
+    dates = df['Date'] if 'Date' in df.columns else df.index
+    return df[np.isin(pd.DatetimeIndex(dates).year, years)]
+
+
+def year_calendar_plot(covers_df,
+                       newspapers=None,
+                       years=None,
+                       out_path='./calendar_view.png',
+                       cube=None):
+    """
+    Calendar view of the highlighted clubs, one plot per newspaper with a
+    row per year. newspapers and years default to all of them. The shares
+    of the legend come from the CoverCube of covers_df, built if not given.
+    """
+    import matplotlib.pyplot as plt
     from matplotlib.patches import Patch
-    fig, axes = plt.subplots(nrows=3,
+    from categorical_yearplot import cyearsplot
+    if newspapers is None:
+        newspapers = Newspaper.names()
+    if cube is None:
+        cube = CoverCube.from_covers_df(covers_df)
+    covers_df = filter_years(covers_df, years)
+
+    fig, axes = plt.subplots(nrows=len(newspapers),
                              ncols=1,
                              squeeze=False,
                              subplot_kw={},
                              gridspec_kw={})
     axes = axes.T[0]
 
-    for newspaper_idx, newspaper_name in enumerate(Newspaper.names()):
+    for newspaper_idx, newspaper_name in enumerate(newspapers):
         newspaper_df = filter_newspapers(covers_df, [newspaper_name.lower()])
-        total_covers = len(newspaper_df)
-        benfica_covers, porto_covers, sporting_covers, other_covers = produce_cover_counts(
-            newspaper_df)
-        newspaper_df = newspaper_df.set_index('Date')['Highlighted_Labels']
-        ax = cyearplot(newspaper_df,
-                       daylabels=PT_DAY_LABELS,
-                       monthlabels=PT_MONTH_LABELS,
-                       linewidth=2,
-                       cmap=ListedColormap(Clubs.colors()),
-                       ax=axes[newspaper_idx])
+        counts = cube.newspaper_counts(newspaper_name, years)
+        total_covers = counts[COVERS]
+        benfica_covers, porto_covers, sporting_covers, other_covers = counts[:COVERS]
+        newspaper_df = newspaper_df.set_index('Date')['Highlighted_Mask']
+        ax = cyearsplot(newspaper_df,
+                        colors=CALENDAR_STYLE['colors'],
+                        daylabels=CALENDAR_STYLE['daylabels'],
+                        monthlabels=CALENDAR_STYLE['monthlabels'],
+                        linewidth=CALENDAR_STYLE['linewidth'],
+                        ax=axes[newspaper_idx])
         ax.set_title(newspaper_name.capitalize())
         ax.legend(handles=[
             Patch(facecolor='r',
@@ -151,59 +336,63 @@ def year_calendar_plot(covers_df):
                   ncol=4,
                   bbox_to_anchor=(0.5, -.5))
 
-        fig.set_figheight(10)
-        fig.set_figwidth(10)
-        plt.tight_layout()
-        plt.savefig('./calendar_view.png', bbox_inches='tight')
+    fig.set_figheight(CALENDAR_STYLE['figheight_per_newspaper'] *
+                      len(newspapers))
+    fig.set_figwidth(CALENDAR_STYLE['figwidth'])
+    fig.tight_layout()
+    fig.savefig(out_path, bbox_inches='tight')
+    return fig
 
 
 def tidify_covers_df(df):
-    def one_hot(labels, size):
-        res = np.zeros(size)
-        res[labels] += 1
-        return res
-
-    df = df.set_index('Date')[['Newspaper', 'Highlighted_Labels']]
-
-    # Split labels into columns
-    # - one hot encoding of labels
-    df['Highlighted_Labels'] = df['Highlighted_Labels'].map(
-        lambda x: one_hot(list(x), len(LabelClass))[Clubs.ids()])
-    # - split vector to multiple cols
-    df[['benfica', 'porto', 'sporting',
-        'other']] = pd.DataFrame(df.Highlighted_Labels.values.tolist(),
-                                 index=df.index)
-    df = df.drop(columns=['Highlighted_Labels'])
+    # Split labels into one hot encoded columns
+    one_hot = unpack_label_masks(df['Highlighted_Mask'])[:, Clubs.ids()]
+
+    df = df.set_index('Date')[['Newspaper']]
+    df[['benfica', 'porto', 'sporting', 'other']] = one_hot.astype(np.uint8)
     return df
 
 
-def month_plot(data):
+def month_plot(data,
+               newspapers=None,
+               years=None,
+               out_path='./month_view.png',
+               cube=None):
+    """
+    Monthly share of covers highlighting each club, one plot per newspaper.
+    newspapers and years default to all of them. The shares come from the
+    CoverCube of data, built if not given.
+    """
+    import matplotlib.pyplot as plt
     import matplotlib.ticker as mtick
+    if newspapers is None:
+        newspapers = Newspaper.names()
+    if cube is None:
+        cube = CoverCube.from_covers_df(data)
 
-    data = tidify_covers_df(data)
     fig, axes = plt.subplots(nrows=1,
-                             ncols=3,
+                             ncols=len(newspapers),
                              squeeze=False,
                              subplot_kw={},
                              gridspec_kw={})
     axes = axes[0]
 
-    for newspaper_idx, n in enumerate(Newspaper.names()):
+    for newspaper_idx, n in enumerate(newspapers):
         newspaper_name = n.lower()
-        newspaper_df = filter_newspapers(data, [newspaper_name])
-        agg_df = newspaper_df.groupby(
-            newspaper_df.index.month)[['benfica', 'porto',
-                                       'sporting']].agg(['mean'])
-
-        agg_df = agg_df
+        counts = cube.month_of_year_counts(newspaper_name, years)
+        months = np.flatnonzero(counts[:, COVERS])
+        shares = counts[months, :3] / counts[months, COVERS:]
 
         ax = axes[newspaper_idx]
-        ax.set_prop_cycle(color=['red', 'blue', 'green'])
-        ax.plot(agg_df[['benfica', 'porto', 'sporting']], 'o--', linewidth=2)
+        ax.set_prop_cycle(color=MONTH_STYLE['colors'])
+        ax.plot(months + 1,
+                shares,
+                'o--',
+                linewidth=MONTH_STYLE['linewidth'])
         ax.set_title(newspaper_name.capitalize())
         ax.set_xticks([i for i in range(1, 12 + 1)])
         ax.yaxis.set_major_formatter(mtick.PercentFormatter(xmax=1.0))
-        ax.set_xticklabels(PT_MONTH_LABELS)
+        ax.set_xticklabels(MONTH_STYLE['monthlabels'])
         if newspaper_idx == 0:
             ax.set_ylabel('Percentagem de capas com destaque')
 
@@ -213,22 +402,35 @@ def month_plot(data):
         ax.set_aspect(aspect=(xright - xleft) / (ytop - ybot) * aspect_ratio)
 
         ax.grid()
-        # print(agg_df)
 
-    fig.set_figheight(7)
-    fig.set_figwidth(23)
-    plt.savefig('./month_view.png', bbox_inches='tight')
+    fig.set_figheight(MONTH_STYLE['figheight'])
+    fig.set_figwidth(MONTH_STYLE['figwidth_per_newspaper'] * len(newspapers))
+    fig.savefig(out_path, bbox_inches='tight')
+    return fig
+
 
+def next_day_analysis(covers_df,
+                      games_df,
+                      lags=(1, ),
+                      outcomes=('win', 'non-win'),
+                      verbose=False):
+    results = next_day_table(covers_df,
+                             games_df,
+                             lags=lags,
+                             outcomes=outcomes)
+    print(results.to_string(index=False, formatters={'Rate': '{:.0%}'.format}))
 
-def next_day_analysis(covers_df, games_df):
-    covers_df = tidify_covers_df(covers_df)
+    if verbose:
+        # List the highlighted/not highlighted dates of each combination
+        covers_df = tidify_covers_df(covers_df)
+        for newspaper in Newspaper.names():
+            print('=======')
+            newspaper = newspaper.lower()
+            for club in ['Benfica', 'Porto', 'Sporting']:
+                print(f'\nAnalysis {newspaper} - {club}')
+                _next_day_analysis(covers_df, games_df, newspaper, club)
 
-    for newspaper in Newspaper.names():
-        print('=======')
-        newspaper = newspaper.lower()
-        for club in ['Benfica', 'Porto', 'Sporting']:
-            print(f'\nAnalysis {newspaper} - {club}')
-            _next_day_analysis(covers_df, games_df, newspaper, club)
+    return results
 
 
 def _next_day_analysis(covers_df, games_df, newspaper, team):
@@ -291,28 +493,286 @@ def _next_day_analysis(covers_df, games_df, newspaper, team):
         unhighlighted_non_wins_df['Newspaper'].isna()]
     print(f'Unhighlighted non_wins: {unhighlighted_non_wins_df.index}')
 
-
-def main():
-    try:
-        covers_df = pd.read_pickle('./data/covers_df.pkl')
-    except FileNotFoundError:
-        covers_df = cover_data_to_pandas()
-        pd.to_pickle(covers_df, './data/covers_df.pkl')
-
+    return {
+        'wins': total_wins,
+        'non_wins': total_non_wins,
+        'highlighted_wins': total_highlighted_wins,
+        'highlighted_non_wins': total_highlighted_non_wins,
+    }
+
+
+def load_cached(pkl_path, key, build_fn, info=None):
+    """
+    Loads the pickled result of build_fn, rebuilding it when the key it was
+    stored with (a fingerprint of its inputs) differs from the given one.
+    If given, info['cache'] is set to 'hit' or 'miss'.
+    """
+    if info is None:
+        info = {}
     try:
-        games_df = pd.read_pickle('./data/games_df.pkl')
+        cached = pd.read_pickle(pkl_path)
+        if isinstance(cached, dict) and cached.get('key') == key:
+            info['cache'] = 'hit'
+            return cached['data']
     except FileNotFoundError:
-        games_df = games_data_to_pandas()
-        pd.to_pickle(games_df, './data/games_df.pkl')
-
-    print('Creating calendar plot')
-    year_calendar_plot(covers_df)
+        pass
+
+    info['cache'] = 'miss'
+    data = build_fn()
+    pd.to_pickle({'key': key, 'data': data}, pkl_path)
+    return data
+
+
+def _load_covers(args, profiler):
+    with profiler.stage('load covers') as info:
+        covers_df = update_covers_df(args.data, info=info)
+        info['rows'] = len(covers_df)
+    return covers_df
+
+
+def _load_games(args, profiler):
+    games_path = os.path.join(args.data, 'games_data.csv')
+    with profiler.stage('load games') as info:
+        games_df = load_cached(
+            os.path.join(args.data, 'games_df.pkl'),
+            (GAMES_CACHE_VERSION, files_fingerprint([games_path])),
+            lambda: games_data_to_pandas(games_path),
+            info=info)
+        info['rows'] = len(games_df)
+    return games_df
+
+
+def _render(specs,
+            args,
+            profiler,
+            stage,
+            covers_df=None,
+            workers=None,
+            figure_times=False):
+    """
+    Renders the specs in one process pool, one figure per worker. With
+    figure_times, the stage also records the time of each view.
+    """
+    from render import render_figures
+    from render_cache import RenderCache
+
+    if covers_df is None:
+        covers_df = _load_covers(args, profiler)
+    # Saved by update_covers_df
+    cube = CoverCube.load(os.path.join(args.data, 'covers_cube.npz'))
+    with profiler.stage(stage) as info:
+        timings = {}
+        rendered = render_figures(
+            specs,
+            covers_df,
+            workers=workers,
+            cache=RenderCache(os.path.join(args.data, 'render_cache')),
+            cube=cube,
+            timings=timings)
+        info['rows'] = len(covers_df)
+        info['rendered'] = len(rendered)
+        info['cached'] = len(specs) - len(rendered)
+        # Measured in the workers, the stage wall time overlaps them
+        if figure_times:
+            for spec in specs:
+                if spec.output_path in timings:
+                    info[f'{spec.view}_s'] = round(
+                        timings[spec.output_path], 3)
+    return rendered
+
+
+def _plot(views, args, profiler, covers_df=None):
+    from render import FigureSpec
+
+    specs = [
+        FigureSpec(
+            None, None, view,
+            getattr(args, 'out', None)
+            or os.path.join(args.out_dir, f'{view}_view.png'))
+        for view in views
+    ]
+    _render(specs, args, profiler, 'plots', covers_df, figure_times=True)
+    for spec in specs:
+        print(f'Saved {spec.output_path}')
+
+
+def _next_day(args, profiler, covers_df=None, games_df=None):
+    if covers_df is None:
+        covers_df = _load_covers(args, profiler)
+    if games_df is None:
+        games_df = _load_games(args, profiler)
+    with profiler.stage('next day analysis') as info:
+        table = next_day_analysis(covers_df, games_df)
+        info['rows'] = len(table)
+
+    if getattr(args, 'resamples', 0) > 0:
+        from significance import next_day_significance
+        with profiler.stage('next day significance') as info:
+            significance = next_day_significance(
+                covers_df,
+                games_df,
+                n_permutations=args.resamples,
+                n_bootstrap=args.resamples,
+                workers=args.workers)
+            info['resamples'] = args.resamples
+        print(
+            significance.to_string(index=False,
+                                   float_format='{:.3f}'.format))
+
+
+def ingest_command(args, profiler):
+    covers_df = _load_covers(args, profiler)
+    games_df = _load_games(args, profiler)
+    print(f'{len(covers_df)} covers, {len(games_df)} games')
+
+
+def calendar_command(args, profiler):
+    _plot(['calendar'], args, profiler)
+
+
+def month_command(args, profiler):
+    _plot(['month'], args, profiler)
+
+
+def report_command(args, profiler):
+    from render import report_specs
+
+    covers_df = _load_covers(args, profiler)
+    specs = report_specs(covers_df, args.out_dir)
+    rendered = _render(specs, args, profiler, 'report', covers_df,
+                       args.workers)
+    print(f'Saved {len(specs)} figures in {args.out_dir} '
+          f'({len(specs) - len(rendered)} unchanged)')
+
+
+def next_day_command(args, profiler):
+    _next_day(args, profiler)
+
+
+def coverage_command(args, profiler):
+    from page_coverage import coverage_frame, CoverageSums
+
+    with profiler.stage('coverage') as info:
+        store = AnnotationStore.open(args.data)
+        arrays = {name: getattr(store, name) for name in ARRAYS}
+        coverage_df = coverage_frame(store.names, arrays)
+        info['rows'] = len(coverage_df)
+        info['boxes'] = len(store.labels)
+    means = CoverageSums(coverage_df).means(args.start, args.end)
+    print('Mean share of the page of each label, overlapping boxes '
+          'counted once')
+    print(means.to_string(float_format='{:.1%}'.format))
+
+
+def crawl_command(args, profiler):
+    from crawl_covers import crawl_from_args
+    with profiler.stage('crawl'):
+        crawl_from_args(args)
+
+
+def all_command(args, profiler):
+    covers_df = _load_covers(args, profiler)
+    games_df = _load_games(args, profiler)
 
-    print('Creating month plot')
-    month_plot(covers_df)
+    print('Creating calendar and month plots')
+    _plot(['calendar', 'month'], args, profiler, covers_df)
 
     print('Next day analysis')
-    next_day_analysis(covers_df, games_df)
-
-
-main()
+    _next_day(args, profiler, covers_df, games_df)
+
+
+def main(argv=None):
+    """
+    Command line of the analysis. Each command only imports what it needs,
+    e.g. matplotlib is only loaded by the plots and bs4 by the crawler.
+    Without a command, every result is produced.
+    """
+    import argparse
+    from profiling import Profiler
+
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--data',
+                        type=str,
+                        default='./data/',
+                        help='folder with labels/ and games_data.csv')
+    parser.add_argument('--out-dir',
+                        type=str,
+                        default='.',
+                        help='folder where the figures are saved')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help='print the time and memory of each stage')
+    parser.add_argument('--trace',
+                        type=str,
+                        default='./profile_trace.json',
+                        help='JSON trace written with --profile')
+    parser.add_argument('--cprofile-dir',
+                        type=str,
+                        default=None,
+                        help='with --profile, dump cProfile stats per stage')
+    parser.add_argument('--trace-memory',
+                        action='store_true',
+                        help='with --profile, record the peak allocations of '
+                        'each stage (slower)')
+    parser.set_defaults(command=all_command)
+
+    commands = parser.add_subparsers()
+    commands.add_parser(
+        'ingest', help='update the cached covers and games data frames'
+    ).set_defaults(command=ingest_command)
+    for name, command in (('calendar', calendar_command), ('month',
+                                                           month_command)):
+        view_parser = commands.add_parser(name, help=f'save the {name} view')
+        view_parser.add_argument('-o',
+                                 '--out',
+                                 type=str,
+                                 default=None,
+                                 help=f'default: <out-dir>/{name}_view.png')
+        view_parser.set_defaults(command=command)
+    report_parser = commands.add_parser(
+        'report',
+        help='save every view for every newspaper and year, and combined')
+    report_parser.add_argument('--workers',
+                               type=int,
+                               default=None,
+                               help='rendering processes (default: every cpu)')
+    report_parser.set_defaults(command=report_command)
+    next_day_parser = commands.add_parser(
+        'next-day', help='print the next day analysis')
+    next_day_parser.add_argument(
+        '--resamples',
+        type=int,
+        default=0,
+        help='permutation and bootstrap resamples of the significance '
+        'tests of the highlight rates (default: no tests)')
+    next_day_parser.add_argument('--workers', type=int, default=1)
+    next_day_parser.set_defaults(command=next_day_command)
+
+    coverage_parser = commands.add_parser(
+        'coverage', help='print the share of the page of each club')
+    coverage_parser.add_argument('--start', type=str, default=None)
+    coverage_parser.add_argument('--end', type=str, default=None)
+    coverage_parser.set_defaults(command=coverage_command)
+
+    crawl_parser = commands.add_parser('crawl',
+                                       help='download the newspaper covers')
+    from crawl_args import add_crawl_arguments
+    add_crawl_arguments(crawl_parser)
+    crawl_parser.set_defaults(command=crawl_command)
+
+    args = parser.parse_args(argv)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    profiler = Profiler(enabled=args.profile,
+                        cprofile_dir=args.cprofile_dir,
+                        trace_memory=args.trace_memory)
+    args.command(args, profiler)
+
+    if args.profile:
+        print(profiler.summary())
+        profiler.to_json(args.trace)
+        print(f'Trace written to {args.trace}')
+
+
+if __name__ == '__main__':
+    main()
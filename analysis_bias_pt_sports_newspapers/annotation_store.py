@@ -0,0 +1,143 @@
+import os
+import glob
+import json
+import numpy as np
+from covers_dataset import (parse_label_files, sort_by_filename,
+                            get_file_path_newspaper_and_date)
+from utils import files_fingerprint
+
+STORE_VERSION = 1
+STORE_DIRNAME = 'annotations'
+
+# Every array is saved as its own .npy file so that it can be memory mapped.
+# - offsets: (n_covers + 1,) boxes of cover i are offsets[i]:offsets[i + 1]
+# - sizes: (n_covers, 2) image width and height
+# - cover_ids, labels, boxes, areas: one entry per box
+ARRAYS = ('offsets', 'sizes', 'cover_ids', 'labels', 'boxes', 'areas')
+
+
+def _label_paths(root):
+    return sort_by_filename(glob.glob(os.path.join(root, 'labels', '*.xml')))
+
+
+def flatten_parsed_labels(parsed_labels):
+    """
+    Concatenates the (labels, boxes, width, height) of many label files
+    into the flat arrays described in ARRAYS.
+    """
+    offsets = [0]
+    sizes = []
+    labels = []
+    boxes = []
+    for cover_labels, cover_boxes, width, height in parsed_labels:
+        labels.append(cover_labels)
+        boxes.append(cover_boxes)
+        sizes.append((width, height))
+        offsets.append(offsets[-1] + len(cover_labels))
+
+    arrays = {}
+    arrays['offsets'] = np.array(offsets, dtype=np.int64)
+    arrays['sizes'] = np.array(sizes, dtype=np.int32).reshape(-1, 2)
+    arrays['cover_ids'] = np.repeat(
+        np.arange(len(sizes), dtype=np.int32), np.diff(arrays['offsets']))
+    arrays['labels'] = np.concatenate(labels + [np.zeros(0, np.int64)])
+    arrays['boxes'] = np.concatenate(boxes + [np.zeros((0, 4), np.float32)])
+    arrays['areas'] = ((arrays['boxes'][:, 2] - arrays['boxes'][:, 0]) *
+                       (arrays['boxes'][:, 3] - arrays['boxes'][:, 1]))
+    return arrays
+
+
+def compile_annotations(label_paths, store_dir, fingerprint=None, workers=1):
+    """
+    Parses every label file and writes the flat box arrays to store_dir.
+    """
+    arrays = flatten_parsed_labels(parse_label_files(label_paths, workers))
+
+    os.makedirs(store_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(store_dir, name + '.npy'), arrays[name])
+
+    # The metadata is written last: a store without it is incomplete and
+    # gets rebuilt.
+    meta = {
+        'version': STORE_VERSION,
+        'fingerprint': fingerprint or files_fingerprint(label_paths),
+        'names': [get_file_path_newspaper_and_date(p) for p in label_paths],
+    }
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+class AnnotationStore(object):
+    """
+    Read-only, memory mapped view over the compiled label files.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.fingerprint = meta['fingerprint']
+        self.names = meta['names']
+        for name in ARRAYS:
+            setattr(self, name,
+                    np.load(os.path.join(store_dir, name + '.npy'),
+                            mmap_mode='r'))
+
+    # Pickled by path: other processes reopen the memory maps instead of
+    # receiving a copy of the arrays
+    def __getstate__(self):
+        return {'store_dir': self.store_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['store_dir'])
+
+    @staticmethod
+    def is_fresh(store_dir, fingerprint):
+        try:
+            with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        return (meta.get('version') == STORE_VERSION
+                and meta.get('fingerprint') == fingerprint)
+
+    @staticmethod
+    def open(root, store_dir=None, rebuild=False, workers=1):
+        """
+        Opens the store of the dataset in root, compiling it first if any
+        label file was added, removed or modified since the last build.
+
+        The whole store is recompiled on any change. This is separate from
+        the per-file manifest of analysis.update_covers_df, which patches
+        the covers frame from the same labels/ folder without the store.
+        """
+        if store_dir is None:
+            store_dir = os.path.join(root, STORE_DIRNAME)
+
+        label_paths = _label_paths(root)
+        fingerprint = files_fingerprint(label_paths)
+        if rebuild or not AnnotationStore.is_fresh(store_dir, fingerprint):
+            compile_annotations(label_paths, store_dir, fingerprint, workers)
+
+        return AnnotationStore(store_dir)
+
+    def label_paths(self, root):
+        return [os.path.join(root, 'labels', n + '.xml') for n in self.names]
+
+    def target(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        boxes = self.boxes[start:end]
+
+        target = {}
+        target['boxes'] = boxes
+        target['labels'] = self.labels[start:end]
+        target['area'] = self.areas[start:end]
+        target["image_id"] = np.array([idx])
+        target["iscrowd"] = np.zeros((boxes.shape[0], ), dtype=np.int64)
+        target["image_width"] = int(self.sizes[idx, 0])
+        target['image_height'] = int(self.sizes[idx, 1])
+
+        return target
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,299 @@
+"""
+Benchmarks for the analysis pipeline. Run from the main folder, e.g.
+
+    python benchmark.py highlights --scale 10
+    python benchmark.py html --pages ./pages/
+    python benchmark.py pipeline --data /tmp/synthetic --generate 3x10
+
+Results are printed as JSON.
+"""
+import json
+import time
+import numpy as np
+from annotation_store import AnnotationStore, ARRAYS
+from cover_metrics import highlighted_labels, MAX_AREA_TOL
+
+
+def best_time(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def tile_arrays(arrays, times):
+    """
+    Repeats the flat box arrays of every cover the given number of times.
+    """
+    counts = np.diff(arrays['offsets'])
+    res = {}
+    res['offsets'] = np.concatenate([[0], np.cumsum(np.tile(counts, times))])
+    res['sizes'] = np.tile(arrays['sizes'], (times, 1))
+    res['cover_ids'] = np.repeat(np.arange(len(counts) * times),
+                                 np.tile(counts, times))
+    res['labels'] = np.tile(arrays['labels'], times)
+    res['boxes'] = np.tile(arrays['boxes'], (times, 1))
+    res['areas'] = np.tile(arrays['areas'], times)
+    return res
+
+
+def loop_highlights(arrays, max_area_tol=MAX_AREA_TOL):
+    """
+    The former per-cover loop of cover_data_to_pandas.
+    """
+    offsets, labels, areas = arrays['offsets'], arrays['labels'], arrays[
+        'areas']
+    res = []
+    for i in range(len(offsets) - 1):
+        cover_areas = areas[offsets[i]:offsets[i + 1]]
+        cover_labels = labels[offsets[i]:offsets[i + 1]]
+        if len(cover_areas) == 0:
+            res.append(None)
+            continue
+        max_area = np.max(cover_areas)
+        res.append(
+            tuple(
+                np.unique(cover_labels[np.isclose(cover_areas,
+                                                  max_area,
+                                                  atol=0,
+                                                  rtol=max_area_tol)])))
+    return res
+
+
+def bench_highlights(root='./data/', scale=1, repeat=5):
+    store = AnnotationStore.open(root)
+    arrays = {name: np.asarray(getattr(store, name)) for name in ARRAYS}
+    if scale > 1:
+        arrays = tile_arrays(arrays, scale)
+    args = (arrays['offsets'], arrays['labels'], arrays['areas'])
+
+    # Both must agree before being compared
+    expected = loop_highlights(arrays)
+    got = highlighted_labels(*args)
+    for row, labels in zip(got, expected):
+        assert labels is None or tuple(np.flatnonzero(row)) == labels
+
+    loop_time = best_time(lambda: loop_highlights(arrays), repeat)
+    batched_time = best_time(lambda: highlighted_labels(*args), repeat)
+    return {
+        'benchmark': 'highlights',
+        'covers': len(arrays['offsets']) - 1,
+        'boxes': len(arrays['labels']),
+        'loop_s': loop_time,
+        'batched_s': batched_time,
+        'speedup': loop_time / batched_time,
+    }
+
+
+def bs4_image_url(html, res):
+    """
+    The extraction of Crawler._crawl: the whole page is parsed with bs4.
+    """
+    import bs4
+    from crawl_covers import Crawler
+
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    picture_tag = soup.find_all('picture')[0]
+    return Crawler.filter_image_sources_by_resolution(picture_tag, res)
+
+
+def bench_html(pages_dir=None, n_pages=50, repeat=5):
+    """
+    Compares the bs4 extraction of the cover url with the targeted parser of
+    crawl_covers.extract_image_url, over the saved pages in pages_dir (*.html)
+    or over fixture pages.
+    """
+    import datetime
+    import glob
+    import os
+    from crawl_covers import Newspaper, Resolution, extract_image_url
+    from crawl_fixtures import cover_page
+
+    if pages_dir is not None:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(pages_dir, '*.html'))):
+            with open(path, 'r') as f:
+                pages.append(f.read())
+    else:
+        day = datetime.date(2019, 1, 1)
+        pages = [
+            cover_page('localhost', newspaper,
+                       day + datetime.timedelta(days=i))
+            for i in range(n_pages // len(Newspaper) + 1)
+            for newspaper in Newspaper
+        ][:n_pages]
+
+    res = Resolution.R1050x1305
+    for page in pages:
+        assert bs4_image_url(page, res) == extract_image_url(page, res)
+
+    bs4_time = best_time(lambda: [bs4_image_url(p, res) for p in pages],
+                         repeat)
+    targeted_time = best_time(
+        lambda: [extract_image_url(p, res) for p in pages], repeat)
+    return {
+        'benchmark': 'html',
+        'pages': len(pages),
+        'bytes': sum(len(p) for p in pages),
+        'bs4_s': bs4_time,
+        'targeted_s': targeted_time,
+        'speedup': bs4_time / targeted_time,
+    }
+
+
+def measure(stage, fn, items=None, trace_memory=True):
+    """
+    Runs fn and reports its wall and cpu time, the peak RSS of the process
+    so far and, with trace_memory, the peak of the memory allocated while
+    it ran. tracemalloc slows down allocations, so that peak is measured
+    in a second run. items is the number of things fn processes, for the
+    throughput. Returns (result of fn, report).
+    """
+    from profiling import Profiler
+
+    profiler = Profiler()
+    with profiler.stage(stage):
+        result = fn()
+    report = profiler.records[0]
+
+    peak_alloc = None
+    if trace_memory:
+        traced = Profiler(trace_memory=True)
+        with traced.stage(stage):
+            fn()
+        peak_alloc = traced.records[0]['peak_alloc_bytes']
+
+    wall = report['wall_s']
+    report['items'] = items
+    report['items_per_s'] = items / wall if items and wall > 0 else None
+    report['peak_alloc_bytes'] = peak_alloc
+    return result, report
+
+
+def bench_pipeline(root, trace_memory=True):
+    """
+    Times every stage of the analysis over the dataset in root (e.g. one
+    made by synthetic.py).
+    """
+    import contextlib
+    import io
+    import os
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import analysis
+    from categorical_yearplot import cyearsplot
+    from covers_dataset import CoversDataset
+
+    reports = []
+    load_images = os.path.isdir(os.path.join(root, 'covers'))
+    dataset = CoversDataset(root, load_images=load_images)
+
+    def iterate_dataset():
+        for i in range(len(dataset)):
+            dataset[i]
+
+    _, report = measure('CoversDataset', iterate_dataset, len(dataset),
+                        trace_memory)
+    reports.append(report)
+
+    covers_df, report = measure(
+        'cover_data_to_pandas',
+        lambda: analysis.cover_data_to_pandas(root, use_store=False),
+        len(dataset), trace_memory)
+    reports.append(report)
+
+    games_df, report = measure(
+        'games_data_to_pandas',
+        lambda: analysis.games_data_to_pandas(
+            os.path.join(root, 'games_data.csv'), start=None, end=None),
+        trace_memory=trace_memory)
+    report['items'] = len(games_df)
+    report['items_per_s'] = len(games_df) / report['wall_s']
+    reports.append(report)
+
+    _, report = measure('tidify_covers_df',
+                        lambda: analysis.tidify_covers_df(covers_df),
+                        len(covers_df), trace_memory)
+    reports.append(report)
+
+    def next_day():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return analysis.next_day_analysis(covers_df, games_df)
+
+    _, report = measure('next_day_analysis', next_day, len(covers_df),
+                        trace_memory)
+    reports.append(report)
+
+    def calendar():
+        for newspaper in covers_df['Newspaper'].unique():
+            fig, ax = plt.subplots()
+            newspaper_df = covers_df[covers_df['Newspaper'] == newspaper]
+            cyearsplot(newspaper_df.set_index('Date')['Highlighted_Mask'],
+                       colors=analysis.CALENDAR_STYLE['colors'],
+                       ax=ax)
+            fig.canvas.draw()
+            plt.close(fig)
+
+    _, report = measure('cyearsplot', calendar, len(covers_df), trace_memory)
+    reports.append(report)
+
+    return {
+        'benchmark': 'pipeline',
+        'root': root,
+        'covers': len(dataset),
+        'stages': reports,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('benchmark', choices=['highlights', 'html', 'pipeline'])
+    parser.add_argument('-d', '--data', type=str, default='./data/')
+    parser.add_argument('--pages',
+                        type=str,
+                        default=None,
+                        help='Directory with saved cover pages (*.html)')
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--generate',
+                        type=str,
+                        default=None,
+                        help='Generate a synthetic dataset of NEWSPAPERSxYEARS '
+                        '(e.g. 3x10) in --data before the pipeline benchmark')
+    parser.add_argument('--boxes', type=float, default=7)
+    parser.add_argument('--images', action='store_true')
+    parser.add_argument('--no-trace-memory',
+                        action='store_true',
+                        help='Skip the tracemalloc run of each stage')
+    parser.add_argument('-o', '--output', type=str, default=None)
+    args = parser.parse_args()
+
+    if args.benchmark == 'highlights':
+        result = bench_highlights(args.data, args.scale, args.repeat)
+    elif args.benchmark == 'html':
+        result = bench_html(args.pages, repeat=args.repeat)
+    elif args.benchmark == 'pipeline':
+        if args.generate is not None:
+            from synthetic import generate_dataset
+            newspapers, years = (int(n) for n in args.generate.split('x'))
+            generate_dataset(args.data,
+                             newspapers=newspapers,
+                             years=years,
+                             boxes_per_cover=args.boxes,
+                             images=args.images)
+        result = bench_pipeline(args.data, not args.no_trace_memory)
+
+    output = json.dumps(result, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,124 +1,138 @@
-import itertools
+"""
+Categorical calendar plots, extending ttresslar/calmap
+(https://github.com/ttresslar/calmap): each date may be associated with
+multiple labels, and its square is filled with one color per label.
+"""
 import datetime as dt
 import numpy as np
-import pandas as pd
-from matplotlib.colors import ListedColormap
 import calendar
 
 
-def cyearplot(data,
-              year=None,
-              vmin=None,
-              vmax=None,
-              cmap='Reds',
-              fillcolor='whitesmoke',
-              linewidth=1,
-              linecolor='white',
-              daylabels=calendar.day_abbr[:],
-              dayticks=True,
-              monthlabels=calendar.month_abbr[1:],
-              monthticks=True,
-              ax=None,
-              **kwargs):
-    """
-    Extends ttresslar/calmap to plot (https://github.com/ttresslar/calmap)
-    categorical year plots. Each date may be associated with multiple labels.
-    The square associated with such dates is filled with multiple colors vertically.
+def calendar_raster(data, year, colors, fillcolor='whitesmoke', cell=None):
     """
+    Builds the RGBA image of the categorical calendar of one year with
+    NumPy broadcasting, without any per-day Python work.
 
-    if year is None:
-        year = data.index.sort_values()[0].year
+    data: Series of label bitmasks (see cover_metrics.pack_label_masks)
+    indexed by date. colors: {label id: color}, labels without a color are
+    not drawn. Each day is a cell x cell square split vertically in one
+    stripe per label; days without data or without any label in colors are
+    filled with fillcolor and the squares outside the year are transparent.
 
-    # Min and max per day.
-    if vmin is None:
-        vmin = data.min()[0]
-    if vmax is None:
-        vmax = data.max()[0]
+    Returns (raster, cell), raster has shape (7 * cell, n_weeks * cell, 4)
+    with rows for the weekdays and columns for the weeks.
+    """
+    from matplotlib.colors import to_rgba, to_rgba_array
+
+    label_ids = np.array(list(colors.keys()), dtype=np.uint8)
+    palette = to_rgba_array(list(colors.values()))
+
+    start = np.datetime64(f'{year}-01-01', 'D')
+    n_days = (np.datetime64(f'{year + 1}-01-01', 'D') - start).astype(int)
+    first_weekday = dt.date(year, 1, 1).weekday()
+
+    # Labels of each day of the year, in palette order
+    days = (data.index.values.astype('datetime64[D]') - start).astype(int)
+    in_year = (days >= 0) & (days < n_days)
+    masks = np.zeros(n_days, dtype=np.uint8)
+    masks[days[in_year]] = data.values[in_year]
+    bits = ((masks[:, None] >> label_ids) & 1).astype(bool)
+    n_labels = bits.sum(axis=1)
+
+    if cell is None:
+        label_combos = np.unique(n_labels[n_labels > 0])
+        cell = int(np.lcm.reduce(label_combos)) if len(label_combos) else 1
+
+    # Color of each pixel column of each day: the column j of a day with k
+    # labels belongs to its (j * k // cell)-th label
+    set_first = np.argsort(~bits, axis=1, kind='stable')
+    stripe = np.arange(cell)[None, :] * n_labels[:, None] // cell
+    stripe_color = np.take_along_axis(set_first, stripe, axis=1)
+    day_rgba = palette[stripe_color]  # n_days x cell x 4
+    day_rgba[n_labels == 0] = to_rgba(fillcolor)
+
+    # Place the days in a (weekday x week) grid of cells
+    n_weeks = (first_weekday + n_days + 6) // 7
+    grid = np.zeros((7 * n_weeks, cell, 4))
+    slots = np.arange(n_days) + first_weekday
+    grid[(slots % 7) * n_weeks + slots // 7] = day_rgba
+    grid = grid.reshape(7, n_weeks, 1, cell, 4)
+    raster = np.broadcast_to(grid, (7, n_weeks, cell, cell, 4))
+    raster = raster.transpose(0, 2, 1, 3, 4).reshape(7 * cell, n_weeks * cell,
+                                                    4)
+    return raster, cell
+
+
+def cyearsplot(data,
+               colors,
+               years=None,
+               fillcolor='whitesmoke',
+               linewidth=1,
+               linecolor='white',
+               daylabels=calendar.day_abbr[:],
+               monthlabels=calendar.month_abbr[1:],
+               ax=None):
+    """
+    Plots the categorical calendar of many years, one row of weeks per
+    year, from a Series of label bitmasks indexed by date. See
+    calendar_raster for the colors and the cells.
+    """
+    import matplotlib.pyplot as plt
 
     if ax is None:
         ax = plt.gca()
 
-    # Filter on year.
-    by_day = data[str(year)]
-
-    # Add missing days.
-    dates_in_year = pd.date_range(start=str(year), end=str(year + 1),
-                                  freq='D')[:-1]
-    by_day = by_day.reindex(dates_in_year, fill_value=np.nan)
-
-    # Create data frame we can pivot later.
-    by_day = pd.DataFrame(
-        dict({
-            'day': by_day.index.dayofweek,
-            'week': by_day.index.week,
-            'data': by_day,
-            'fill': 1
-        }))
-
-    # There may be some days assigned to previous year's last week or
-    # next year's first week. We create new week numbers for them so
-    # the ordering stays intact and week/day pairs unique.
-    by_day.loc[(by_day.index.month == 1) & (by_day.week > 50), 'week'] = 0
-    by_day.loc[(by_day.index.month == 12) & (by_day.week < 10), 'week'] \
-        = by_day.week.max() + 1
-
-    plot_data = by_day.pivot('day', 'week', 'data')
-
-    label_combos = data.map(lambda x: len(x)).unique()
-    lcm = np.lcm.reduce(label_combos)
-
-    def expand_cols(x):
-        if x is np.nan:
-            x = (np.nan, )
-        return list(
-            itertools.chain.from_iterable(
-                itertools.repeat(n, lcm // len(x)) for n in x))
-
-    # First, expand the labels so that each cell has lcm columns.
-    # Then reshape so that the rows correspond to the weekdays.
-    # Finally, expand the labels so that each cell has lcm rows.
-    plot_data = plot_data.applymap(expand_cols)
-    plot_data = np.vstack(plot_data.values.tolist()).reshape(7, -1)
-    plot_data = np.repeat(plot_data, lcm, axis=0)
-    plot_data = np.ma.masked_where(np.isnan(plot_data), plot_data)
-
-    # Compute the cells that dont need to be filled
-    fill_data = np.array(by_day.pivot('day', 'week', 'fill').values)
-    fill_data = np.repeat(np.repeat(fill_data, lcm, axis=0), lcm, axis=1)
-    fill_data = np.ma.masked_where(np.isnan(fill_data), fill_data)
-
-    ax.imshow(fill_data, vmin=0, vmax=1, cmap=ListedColormap([fillcolor]))
-    ax.imshow(plot_data, vmin=vmin, vmax=vmax, cmap=cmap)
-
-    # Get indices for monthlabels.
-    if monthticks is True:
-        monthticks = range(len(monthlabels))
-    elif monthticks is False:
-        monthticks = []
-    elif isinstance(monthticks, int):
-        monthticks = range(len(monthlabels))[monthticks // 2::monthticks]
-
-    # Get indices for daylabels.
-    if dayticks is True:
-        dayticks = range(len(daylabels))
-    elif dayticks is False:
-        dayticks = []
-    elif isinstance(dayticks, int):
-        dayticks = range(len(daylabels))[dayticks // 2::dayticks]
-
-    # Ticks for x/y axis labels
-    ax.set_yticks(np.arange(lcm / 2 - .5, (6 + 1) * lcm, lcm))
-    ax.set_yticklabels(daylabels)
-    ax.set_xticks([
-        by_day.ix[dt.date(year, i + 1, 15)].week * lcm - lcm / 2 - .5
-        for i in monthticks
-    ])
-    ax.set_xticklabels([monthlabels[i] for i in monthticks], ha='center')
-
-    # Ticks for the grid-like effect
-    ax.set_yticks(np.arange(lcm - .5, (6 + 1) * lcm, lcm), minor=True)
-    last_week = by_day['week'].max()
-    ax.set_xticks(np.arange(lcm - .5, last_week * lcm, lcm), minor=True)
+    if years is None:
+        years = np.unique(data.index.year)
+    if len(years) == 0:
+        # Nothing to draw, e.g. a newspaper without covers
+        ax.set_xticks([])
+        ax.set_yticks([])
+        return ax
+
+    # Same cell size for every year, so that the rows line up
+    label_ids = np.array(list(colors.keys()), dtype=np.uint8)
+    bits = (data.values.astype(np.uint8)[:, None] >> label_ids) & 1
+    label_combos = np.unique(bits.sum(axis=1))
+    label_combos = label_combos[label_combos > 0]
+    cell = int(np.lcm.reduce(label_combos)) if len(label_combos) else 1
+
+    rasters = [
+        calendar_raster(data, year, colors, fillcolor, cell)[0]
+        for year in years
+    ]
+    n_cols = max(r.shape[1] for r in rasters)
+    # A blank row of cells between years
+    row_height = 8 * cell
+    image = np.zeros((row_height * len(years) - cell, n_cols, 4))
+    for i, raster in enumerate(rasters):
+        image[i * row_height:i * row_height + 7 * cell, :raster.shape[1]] = raster
+
+    ax.imshow(image, interpolation='nearest')
+
+    # Weekday labels on every year, months on the weeks of the first year
+    day_ticks = [(i * row_height + (d + .5) * cell - .5) for i in range(len(years))
+                 for d in range(7)]
+    ax.set_yticks(day_ticks)
+    ax.set_yticklabels(list(daylabels) * len(years))
+    first_weekday = dt.date(years[0], 1, 1).weekday()
+    ax.set_xticks([(dt.date(years[0], m, 15).timetuple().tm_yday - 1 +
+                    first_weekday) // 7 * cell + cell / 2 - .5
+                   for m in range(1, 13)])
+    ax.set_xticklabels(monthlabels, ha='center')
+    if len(years) > 1:
+        for i, year in enumerate(years):
+            ax.text(n_cols + cell / 2,
+                    i * row_height + 3.5 * cell,
+                    str(year),
+                    rotation=90,
+                    ha='left',
+                    va='center')
+
+    # Grid-like effect
+    ax.set_yticks(np.arange(cell - .5, image.shape[0], cell), minor=True)
+    ax.set_xticks(np.arange(cell - .5, n_cols, cell), minor=True)
     ax.grid(which='minor', color=linecolor, linestyle='-', linewidth=linewidth)
+    ax.tick_params(which='minor', length=0)
 
     return ax
@@ -0,0 +1,173 @@
+"""
+Batched iteration over a CoversDataset, loading the next batches in worker
+threads (or processes) while the current one is consumed.
+
+    loader = CoverBatches(CoversDataset(root, use_image_store=True),
+                          batch_size=32, shuffle=True, workers=4)
+    for batch in loader:
+        batch['images']   # (B, H, W, 3) uint8, or a list if shapes differ
+        batch['boxes']    # (B, max boxes, 4) float32, zero padded
+        batch['labels']   # (B, max boxes) int64, padded with PAD_LABEL
+        batch['counts']   # (B,) number of boxes of each cover
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+
+PAD_LABEL = -1
+
+# Set in each worker process by _init_worker
+_dataset = None
+
+
+def collate(items):
+    """
+    Batch of (image, target) items of CoversDataset. The per box arrays are
+    padded to the largest number of boxes in the batch.
+    """
+    images = [img for img, _ in items]
+    targets = [target for _, target in items]
+    counts = np.array([len(t['labels']) for t in targets], dtype=np.int64)
+    n, max_boxes = len(items), int(counts.max()) if len(items) else 0
+
+    boxes = np.zeros((n, max_boxes, 4), dtype=np.float32)
+    labels = np.full((n, max_boxes), PAD_LABEL, dtype=np.int64)
+    areas = np.zeros((n, max_boxes), dtype=np.float32)
+    for i, (target, count) in enumerate(zip(targets, counts)):
+        boxes[i, :count] = target['boxes']
+        labels[i, :count] = target['labels']
+        areas[i, :count] = target['area']
+
+    if images and all(isinstance(img, np.ndarray) for img in images) and len(
+            set(img.shape for img in images)) == 1:
+        images = np.stack(images)
+
+    batch = {}
+    batch['images'] = images
+    batch['boxes'] = boxes
+    batch['labels'] = labels
+    batch['area'] = areas
+    batch['counts'] = counts
+    batch['image_id'] = np.concatenate([t['image_id'] for t in targets]
+                                       ) if targets else np.zeros(0, np.int64)
+    batch['image_width'] = np.array([t['image_width'] for t in targets])
+    batch['image_height'] = np.array([t['image_height'] for t in targets])
+    return batch
+
+
+def load_batch(dataset, indices):
+    return collate([dataset[int(idx)] for idx in indices])
+
+
+def _init_worker(dataset):
+    global _dataset
+    _dataset = dataset
+
+
+def _load_batch_in_worker(indices):
+    return load_batch(_dataset, indices)
+
+
+class CoverBatches(object):
+    """
+    Iterable of collated batches of dataset.
+
+    - shuffle: visit the covers in a random order, a different one per
+      epoch (see set_epoch), reproducible given the seed.
+    - num_shards, shard: only iterate over every num_shards-th cover
+      starting at shard, e.g. one shard per training process. Every shard
+      sees the same order.
+    - workers: threads loading batches ahead of the consumer, or processes
+      with use_processes=True. The dataset is pickled to each of them:
+      its image and annotation stores and archive are pickled by path and
+      memory mapped again in the worker, not copied.
+      0 loads the batches in the consumer.
+    - prefetch: batches loaded ahead, per worker.
+    """
+    def __init__(self,
+                 dataset,
+                 batch_size=32,
+                 shuffle=False,
+                 seed=0,
+                 num_shards=1,
+                 shard=0,
+                 drop_last=False,
+                 workers=2,
+                 prefetch=2,
+                 use_processes=False):
+        if not 0 <= shard < num_shards:
+            raise ValueError(f'shard must be in [0, {num_shards})')
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_shards = num_shards
+        self.shard = shard
+        self.drop_last = drop_last
+        self.workers = workers
+        self.prefetch = prefetch
+        self.use_processes = use_processes
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def indices(self):
+        indices = np.arange(len(self.dataset))
+        if self.shuffle:
+            rng = np.random.default_rng([self.seed, self.epoch])
+            rng.shuffle(indices)
+        return indices[self.shard::self.num_shards]
+
+    def batches_indices(self):
+        indices = self.indices()
+        n_batches = len(self)
+        return [
+            indices[i * self.batch_size:(i + 1) * self.batch_size]
+            for i in range(n_batches)
+        ]
+
+    def __len__(self):
+        n = len(self.indices())
+        if self.drop_last:
+            return n // self.batch_size
+        return -(-n // self.batch_size)
+
+    def __iter__(self):
+        batches = self.batches_indices()
+        if self.workers <= 0:
+            for indices in batches:
+                yield load_batch(self.dataset, indices)
+            return
+
+        if self.use_processes:
+            executor = ProcessPoolExecutor(self.workers,
+                                           initializer=_init_worker,
+                                           initargs=(self.dataset, ))
+            load = _load_batch_in_worker
+        else:
+            executor = ThreadPoolExecutor(self.workers)
+            dataset = self.dataset
+
+            def load(indices):
+                return load_batch(dataset, indices)
+
+        # Keep a bounded window of batches in flight, yielded in order
+        window = max(1, self.workers * self.prefetch)
+        pending = deque()
+        batches = iter(batches)
+        try:
+            for indices in batches:
+                pending.append(executor.submit(load, indices))
+                if len(pending) >= window:
+                    break
+            while pending:
+                batch = pending.popleft().result()
+                for indices in batches:
+                    pending.append(executor.submit(load, indices))
+                    break
+                yield batch
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
@@ -0,0 +1,198 @@
+"""
+Dense newspaper x channel x day cube of the covers, to answer share
+queries over any date range without filtering the covers frame.
+
+cube[n, c, d] is 1 when the cover of newspaper n on day start + d
+highlighted club CHANNELS[c], and cube[n, COVERS, d] is 1 when there is a
+cover at all. Counts over a range of days are differences of the
+cumulative sums along the days, so every query is a couple of slices.
+"""
+import datetime as dt
+import numpy as np
+import pandas as pd
+from cover_metrics import unpack_label_masks
+from utils import Clubs, to_day
+
+CUBE_VERSION = 1
+CHANNELS = [c.name.lower() for c in Clubs] + ['covers']
+COVERS = CHANNELS.index('covers')
+# The football season starts in August
+SEASON_START_MONTH = 8
+
+
+def _period_starts(first, last, period):
+    """First day of every period overlapping [first, last]"""
+    if period == 'day':
+        return np.arange(first, last + 1)
+    if period == 'week':
+        # 1970-01-01 was a Thursday, weeks start on Monday
+        weekday = (first - np.datetime64('1970-01-05')).astype(np.int64) % 7
+        monday = first - np.timedelta64(weekday, 'D')
+        return np.arange(monday, last + 1, 7)
+    if period == 'month':
+        months = np.arange(first.astype('datetime64[M]'),
+                           last.astype('datetime64[M]') + 1)
+        return months.astype('datetime64[D]')
+    if period == 'year':
+        years = np.arange(first.astype('datetime64[Y]'),
+                          last.astype('datetime64[Y]') + 1)
+        return years.astype('datetime64[D]')
+    if period == 'season':
+        first_date = first.astype(dt.date)
+        year = first_date.year - (first_date.month < SEASON_START_MONTH)
+        starts = []
+        while True:
+            start = np.datetime64(dt.date(year, SEASON_START_MONTH, 1), 'D')
+            if start > last:
+                break
+            starts.append(start)
+            year += 1
+        return np.array(starts, dtype='datetime64[D]')
+    raise ValueError(f'Unknown period {period}')
+
+
+class CoverCube(object):
+    """
+    See the module docstring. newspapers are the lower case names of the
+    covers frame, start the first day of the cube.
+    """
+    def __init__(self, cube, newspapers, start):
+        self.cube = cube
+        self.newspapers = list(newspapers)
+        self.start = np.datetime64(start, 'D')
+        self._cumsum = None
+
+    @staticmethod
+    def from_covers_df(covers_df, newspapers=None):
+        if newspapers is None:
+            newspapers = sorted(covers_df['Newspaper'].unique())
+        days = covers_df['Date'].values.astype('datetime64[D]')
+        if len(days) == 0:
+            return CoverCube(
+                np.zeros((len(newspapers), len(CHANNELS), 0), np.uint8),
+                newspapers, '1970-01-01')
+
+        start = days.min()
+        n_days = int((days.max() - start).astype(np.int64)) + 1
+        newspaper_idx = pd.Index(newspapers).get_indexer(covers_df['Newspaper'])
+        known = newspaper_idx >= 0
+        day_idx = (days - start).astype(np.int64)[known]
+        channels = np.zeros((known.sum(), len(CHANNELS)), dtype=np.uint8)
+        channels[:, :COVERS] = unpack_label_masks(
+            covers_df['Highlighted_Mask'].values[known])[:, Clubs.ids()]
+        channels[:, COVERS] = 1
+
+        cube = np.zeros((len(newspapers), len(CHANNELS), n_days),
+                        dtype=np.uint8)
+        cube[newspaper_idx[known], :, day_idx] = channels
+        return CoverCube(cube, newspapers, start)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f,
+                     version=CUBE_VERSION,
+                     cube=self.cube,
+                     newspapers=np.array(self.newspapers),
+                     start=self.start)
+
+    @staticmethod
+    def load(path):
+        """The saved cube, or None if missing or outdated"""
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != CUBE_VERSION:
+                    return None
+                return CoverCube(data['cube'], data['newspapers'].tolist(),
+                                 data['start'])
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    @property
+    def n_days(self):
+        return self.cube.shape[2]
+
+    @property
+    def cumsum(self):
+        """(newspapers, channels, n_days + 1) counts before each day"""
+        if self._cumsum is None:
+            self._cumsum = np.zeros(self.cube.shape[:2] + (self.n_days + 1, ),
+                                    dtype=np.int32)
+            np.cumsum(self.cube, axis=2, out=self._cumsum[..., 1:])
+        return self._cumsum
+
+    def day_index(self, date):
+        """Ordinal of date in the cube, clipped to [0, n_days]"""
+        idx = int((to_day(date) - self.start).astype(np.int64))
+        return min(max(idx, 0), self.n_days)
+
+    def _newspaper_rows(self, newspapers):
+        if newspapers is None:
+            return slice(None)
+        return [self.newspapers.index(n.lower()) for n in newspapers]
+
+    def counts(self, start=None, end=None, newspapers=None):
+        """
+        (newspapers, channels) number of covers highlighting each club, and
+        of covers, from start to end inclusive (default the whole cube).
+        """
+        first = 0 if start is None else self.day_index(start)
+        last = self.n_days if end is None else self.day_index(end) + 1
+        last = max(min(last, self.n_days), first)
+        cumsum = self.cumsum[self._newspaper_rows(newspapers)]
+        return cumsum[..., last] - cumsum[..., first]
+
+    def shares(self, start=None, end=None, newspapers=None):
+        """(newspapers, clubs) share of the covers highlighting each club"""
+        counts = self.counts(start, end, newspapers)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return counts[:, :COVERS] / counts[:, COVERS:]
+
+    def period_counts(self, period='month', newspapers=None):
+        """
+        Counts of every day, week, month, year or season (from August) of
+        the cube. Returns the first day of each period and the
+        (periods, newspapers, channels) counts.
+        """
+        last = self.start + np.timedelta64(max(self.n_days - 1, 0), 'D')
+        starts = _period_starts(self.start, last, period)
+        bounds = np.clip((starts - self.start).astype(np.int64), 0,
+                         self.n_days)
+        bounds = np.append(bounds, self.n_days)
+        cumsum = self.cumsum[self._newspaper_rows(newspapers)]
+        counts = np.diff(cumsum[..., bounds], axis=-1)
+        return starts, np.moveaxis(counts, -1, 0)
+
+    def period_shares(self, period='month', newspapers=None):
+        """Like period_counts, with the share of covers of each club"""
+        starts, counts = self.period_counts(period, newspapers)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return starts, counts[..., :COVERS] / counts[..., COVERS:]
+
+    def newspaper_counts(self, newspaper, years=None):
+        """
+        (channels,) counts of newspaper over the given years (default the
+        whole cube), zero if it is not in the cube.
+        """
+        if newspaper.lower() not in self.newspapers:
+            return np.zeros(len(CHANNELS), dtype=np.int64)
+        if years is None:
+            return self.counts(newspapers=[newspaper])[0]
+        return sum(
+            self.counts(f'{y}-01-01', f'{y}-12-31', [newspaper])[0]
+            for y in years)
+
+    def month_of_year_counts(self, newspaper, years=None):
+        """
+        (12, channels) counts of newspaper by month of the year, over the
+        given years (default the whole cube), zero if it is not in the cube.
+        """
+        res = np.zeros((12, len(CHANNELS)), dtype=np.int64)
+        if newspaper.lower() not in self.newspapers:
+            return res
+        starts, counts = self.period_counts('month', [newspaper])
+        months = starts.astype('datetime64[M]').astype(np.int64)
+        if years is not None:
+            keep = np.isin(months // 12 + 1970, years)
+            months, counts = months[keep], counts[keep]
+        np.add.at(res, months % 12, counts[:, 0])
+        return res
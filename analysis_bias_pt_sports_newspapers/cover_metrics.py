@@ -0,0 +1,98 @@
+import numpy as np
+from utils import LabelClass
+
+# A label is highlighted in a cover if one of its boxes is within this
+# relative tolerance of the largest box of the cover.
+MAX_AREA_TOL = .3
+
+
+def segment_ids(offsets):
+    """
+    The cover of each box, given the per-cover offsets into the box arrays.
+    """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def segment_max(values, offsets):
+    """
+    Max of values in each segment offsets[i]:offsets[i + 1]. Empty segments
+    get 0.
+    """
+    res = np.zeros(len(offsets) - 1, dtype=values.dtype)
+    nonempty = np.diff(offsets) > 0
+    if nonempty.any():
+        res[nonempty] = np.maximum.reduceat(values, offsets[:-1][nonempty])
+    return res
+
+
+def highlighted_labels(offsets, labels, areas, max_area_tol=MAX_AREA_TOL):
+    """
+    Boolean matrix (covers x LabelClass) with the labels whose area is
+    within max_area_tol of the largest box of each cover.
+    """
+    offsets = np.asarray(offsets)
+    labels = np.asarray(labels)
+    areas = np.asarray(areas)
+
+    covers = segment_ids(offsets)
+    max_areas = segment_max(areas, offsets)[covers]
+    # Same as np.isclose(areas, max_area, atol=0, rtol=max_area_tol)
+    close = np.abs(areas - max_areas) <= max_area_tol * np.abs(max_areas)
+
+    res = np.zeros((len(offsets) - 1, len(LabelClass)), dtype=bool)
+    res[covers[close], labels[close]] = True
+    return res
+
+
+def label_areas(offsets, labels, areas):
+    """
+    Matrix (covers x LabelClass) with the summed box area of each label.
+    """
+    n_covers, n_labels = len(offsets) - 1, len(LabelClass)
+    covers = segment_ids(offsets)
+    sums = np.bincount(covers * n_labels + np.asarray(labels),
+                       weights=areas,
+                       minlength=n_covers * n_labels)
+    return sums.reshape(n_covers, n_labels)
+
+
+def cover_metrics(arrays, max_area_tol=MAX_AREA_TOL):
+    """
+    Computes the per-cover metrics over the flat box arrays of every cover
+    (see annotation_store.ARRAYS) in one pass:
+    - has_boxes: covers with at least one box (holidays have none)
+    - highlighted: covers x LabelClass highlighted labels
+    - areas: covers x LabelClass summed box area
+    - coverage: areas as a fraction of the cover area
+    """
+    offsets, labels, areas = arrays['offsets'], arrays['labels'], arrays[
+        'areas']
+    sizes = np.asarray(arrays['sizes'], dtype=np.float64)
+
+    metrics = {}
+    metrics['has_boxes'] = np.diff(offsets) > 0
+    metrics['highlighted'] = highlighted_labels(offsets, labels, areas,
+                                                max_area_tol)
+    metrics['areas'] = label_areas(offsets, labels, areas)
+    metrics['coverage'] = metrics['areas'] / (sizes[:, 0] *
+                                              sizes[:, 1])[:, None]
+    return metrics
+
+
+def pack_label_masks(label_matrix):
+    """
+    Packs a boolean (covers x LabelClass) matrix into one uint8 bitmask per
+    cover, where bit i is set when the label with id i is present.
+    """
+    weights = (1 << np.arange(len(LabelClass))).astype(np.uint8)
+    return (np.asarray(label_matrix, dtype=np.uint8) * weights).sum(
+        axis=1, dtype=np.uint8)
+
+
+def unpack_label_masks(masks):
+    """
+    Inverse of pack_label_masks: boolean (covers x LabelClass) matrix.
+    """
+    masks = np.asarray(masks, dtype=np.uint8)
+    return ((masks[:, None] >> np.arange(len(LabelClass), dtype=np.uint8)) &
+            1).astype(bool)
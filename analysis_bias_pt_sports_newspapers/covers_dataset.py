@@ -1,9 +1,7 @@
 import os
-import glob
 import numpy as np
-from PIL import Image
 import xml.etree.ElementTree as ET
-from utils import LabelClass
+from utils import LabelClass, pool_map
 
 
 def get_file_path_newspaper(file_path):
@@ -31,39 +29,170 @@ def sort_by_filename(l):
         reverse=True)
 
 
+BOX_FIELDS = ('xmin', 'ymin', 'xmax', 'ymax')
+
+
+def parse_label_file(label_path):
+    """
+    Parses a Pascal VOC label file into (labels, boxes, width, height).
+
+    The file is streamed with iterparse and only the size and the
+    object/name, object/bndbox elements are read.
+    """
+    labels = []
+    boxes = []
+    width = height = None
+    box = {}
+    path = []
+    for event, elem in ET.iterparse(label_path, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem.tag)
+            continue
+
+        path.pop()
+        parent = path[-1] if path else None
+        if parent == 'bndbox' and elem.tag in BOX_FIELDS:
+            box[elem.tag] = int(elem.text)
+        elif parent == 'object' and elem.tag == 'name':
+            labels.append(LabelClass[elem.text.upper()].id)
+        elif parent == 'size' and elem.tag == 'width':
+            width = int(elem.text)
+        elif parent == 'size' and elem.tag == 'height':
+            height = int(elem.text)
+        elif elem.tag == 'object':
+            boxes.append([box[f] for f in BOX_FIELDS])
+            box = {}
+            elem.clear()
+
+    labels = np.array(labels, dtype=np.int64)
+    boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+    return labels, boxes, width, height
+
+
+def parse_label_files(label_paths, workers=1, chunksize=64):
+    """
+    Parses many label files, in a process pool when workers > 1 (None uses
+    every cpu). Results are returned in the order of label_paths. Falls
+    back to parsing serially if a pool can not be started.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, max(1, len(label_paths) // chunksize))
+    return pool_map(parse_label_file, label_paths, workers, chunksize)
+
+
 class CoversDataset(object):
-    def __init__(self, root):
-        self.images = sort_by_filename(
-            glob.glob(os.path.join(root, 'covers', '*.jpeg')))
-        self.labels = sort_by_filename(
-            glob.glob(os.path.join(root, 'labels', '*.xml')))
+    """
+    Pairs the newspaper covers with their labels, by (newspaper, date) (see
+    covers_index.py). Labels without a cover are skipped, or raise a
+    ValueError with missing_covers='error'; covers without labels are
+    ignored. Both are listed in unpaired_labels and unpaired_covers.
+
+    With load_images=False only the labels are read: the covers directory
+    is not scanned (it may be missing) and no JPEG is ever decoded.
+    With use_store=True the targets come from the compiled annotation
+    store (see annotation_store.py) instead of the XML files.
+    With use_image_store=True the covers are decoded once into the image
+    store (see image_store.py), resized to image_size=(width, height) if
+    given, and returned as uint8 arrays viewing it. The boxes are rescaled
+    with the covers.
+    With archive, the labels and covers are read from that packed archive
+    (see dataset_archive.py) instead of root, which is then unused. labels
+    and images hold the paths the files would have in the archive root.
+    """
+    def __init__(self,
+                 root,
+                 load_images=True,
+                 use_store=False,
+                 use_image_store=False,
+                 image_size=None,
+                 workers=1,
+                 missing_covers='skip',
+                 archive=None):
+        from covers_index import CoversIndex
+
+        self.load_images = load_images
+        self.store = None
+        self.image_store = None
+        self.archive = None
+        if archive is not None:
+            if use_store or use_image_store:
+                raise ValueError('The stores can not be built from an archive')
+            from dataset_archive import DatasetArchive
+            self.archive = DatasetArchive.open(archive)
+            self.index = self.archive.index()
+        else:
+            self.index = CoversIndex.scan(root, covers=load_images)
+        self.unpaired_covers = self.index.covers_without_labels()
+        if load_images:
+            self.unpaired_labels = self.index.labels_without_covers()
+            if self.unpaired_labels and missing_covers == 'error':
+                raise ValueError(
+                    f'{len(self.unpaired_labels)} labels without a cover, '
+                    f'e.g. {self.unpaired_labels[0]}')
+            positions = self.index.paired()
+        else:
+            self.unpaired_labels = []
+            positions = np.flatnonzero(self.index.has_label)
+
+        self.keys = [self.index.keys[i] for i in positions]
+        self.labels = [self.index.label_path(i) for i in positions]
+        if load_images:
+            self.images = [self.index.cover_path(i) for i in positions]
+        else:
+            self.images = []
+
+        # Position of each key in the stores, which may hold other covers
+        if use_store:
+            from annotation_store import AnnotationStore
+            self.store = AnnotationStore.open(root)
+            self._store_ids = self._positions_in(self.store.names)
+        if load_images and use_image_store:
+            from image_store import ImageStore
+            self.image_store = ImageStore.open(root,
+                                               size=image_size,
+                                               workers=workers)
+            self._image_ids = self._positions_in(self.image_store.names)
+
+    def _positions_in(self, names):
+        positions = {name: i for i, name in enumerate(names)}
+        return np.array([positions[key] for key in self.keys], dtype=np.int64)
 
     def __getitem__(self, idx):
-        img_path = self.images[idx]
-        label_path = self.labels[idx]
-
-        assert get_file_path_newspaper_and_date(img_path) == get_file_path_newspaper_and_date(label_path)
-
-        img = Image.open(img_path).convert("RGB")
-
-        labels = []
-        boxes = []
-        areas = []
-        tree = ET.parse(label_path)
-        for obj in tree.findall('object'):
-            obj_name = obj.find('name').text
-
-            label_class = LabelClass[obj_name.upper()]
-            labels.append(label_class.id)
-            box = obj.find('bndbox')
-            xmin, ymin = int(box.find('xmin').text), int(box.find('ymin').text)
-            xmax, ymax = int(box.find('xmax').text), int(box.find('ymax').text)
-            boxes.append([xmin, ymin, xmax, ymax])
-            areas.append((xmax - xmin) * (ymax - ymin))
-
-        labels = np.array(labels, dtype=np.int64)
-        boxes = np.array(boxes, dtype=np.float32)
-        areas = np.array(areas, dtype=np.float32)
+        img = None
+        if self.load_images:
+            if self.image_store is not None:
+                from image_store import rescale_target
+                image_id = self._image_ids[idx]
+                target = rescale_target(self.get_target(idx),
+                                        *self.image_store.sizes[image_id])
+                return self.image_store.image(image_id), target
+
+            from PIL import Image
+            img_file = self.images[idx]
+            if self.archive is not None:
+                img_file = self.archive.cover_file(self.keys[idx])
+            img = Image.open(img_file).convert("RGB")
+
+        return img, self.get_target(idx)
+
+    def get_target(self, idx):
+        if self.store is not None:
+            target = self.store.target(self._store_ids[idx])
+            target['image_id'] = np.array([idx])
+            return target
+
+        return self.make_target(idx, parse_label_file(self._label_file(idx)))
+
+    def _label_file(self, idx):
+        if self.archive is not None:
+            return self.archive.label_file(self.keys[idx])
+        return self.labels[idx]
+
+    @staticmethod
+    def make_target(idx, parsed_label):
+        labels, boxes, width, height = parsed_label
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
         image_id = np.array([idx])
         iscrowd = np.zeros((boxes.shape[0], ), dtype=np.int64)
 
@@ -73,10 +202,25 @@ class CoversDataset(object):
         target['area'] = areas
         target["image_id"] = image_id
         target["iscrowd"] = iscrowd
-        target["image_width"] = int(tree.find('size').find('width').text)
-        target['image_height'] = int(tree.find('size').find('height').text)
-
-        return img, target
+        target["image_width"] = width
+        target['image_height'] = height
+
+        return target
+
+    def targets(self, workers=1):
+        """
+        Yields (label_path, target) for every cover, without the images.
+        With workers > 1 the label files are parsed in a process pool,
+        unless they are read from an archive.
+        """
+        if self.store is not None or self.archive is not None:
+            for idx in range(len(self)):
+                yield self.labels[idx], self.get_target(idx)
+            return
+
+        parsed_labels = parse_label_files(self.labels, workers)
+        for idx, parsed_label in enumerate(parsed_labels):
+            yield self.labels[idx], self.make_target(idx, parsed_label)
 
     def __len__(self):
-        return len(self.images)
+        return len(self.labels)
@@ -0,0 +1,141 @@
+"""
+Index of the label and cover files of a dataset, keyed by (newspaper, date).
+
+The labels and covers directories are scanned once. Each key is an entry
+of a few arrays, in the order of the files of CoversDataset (newspapers
+and dates descending):
+- keys: <newspaper>_<date>, the file name without extension
+- codes: index of the newspaper in newspapers
+- days: date, as datetime64[D]
+- has_label, has_cover: whether labels/<key>.xml and covers/<key>.jpeg exist
+"""
+import os
+import re
+import datetime as dt
+import numpy as np
+from utils import to_day
+
+KEY_RE = re.compile(r'^(.+)_(\d{4}-\d{2}-\d{2})$')
+
+
+def scan_keys(directory, ext):
+    """Keys of the files of directory with the given extension"""
+    keys = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                stem, entry_ext = os.path.splitext(entry.name)
+                if entry_ext == ext and KEY_RE.match(stem):
+                    keys.append(stem)
+    except FileNotFoundError:
+        pass
+    return keys
+
+
+class CoversIndex(object):
+    """
+    See the module docstring. Built with CoversIndex.scan(root).
+    """
+    def __init__(self, root, keys, has_label, has_cover):
+        self.root = root
+        self.keys = keys
+        self.has_label = has_label
+        self.has_cover = has_cover
+        self._positions = {key: idx for idx, key in enumerate(keys)}
+
+        names = [KEY_RE.match(key).groups() for key in keys]
+        self.newspapers = sorted(set(n for n, _ in names), reverse=True)
+        codes = {n: code for code, n in enumerate(self.newspapers)}
+        self.codes = np.array([codes[n] for n, _ in names], dtype=np.int16)
+        self.days = np.array([d for _, d in names], dtype='datetime64[D]')
+
+        # Keys are sorted by newspaper, so each one is a contiguous block
+        bounds = np.searchsorted(self.codes,
+                                 np.arange(len(self.newspapers) + 1))
+        self._blocks = {
+            n: (bounds[code], bounds[code + 1])
+            for code, n in enumerate(self.newspapers)
+        }
+
+    @staticmethod
+    def scan(root, covers=True):
+        """
+        Index of the dataset in root. With covers=False the covers directory
+        is not scanned and has_cover is False everywhere.
+        """
+        labels = set(scan_keys(os.path.join(root, 'labels'), '.xml'))
+        images = set(scan_keys(os.path.join(root, 'covers'), '.jpeg')
+                     ) if covers else set()
+
+        # Same order as sort_by_filename, but newspaper first so that a
+        # newspaper whose name prefixes another's can not be interleaved
+        keys = sorted(labels | images,
+                      key=lambda k: KEY_RE.match(k).groups(),
+                      reverse=True)
+        has_label = np.array([k in labels for k in keys], dtype=bool)
+        has_cover = np.array([k in images for k in keys], dtype=bool)
+        return CoversIndex(root, keys, has_label, has_cover)
+
+    def find(self, newspaper, date):
+        """Position of (newspaper, date), or None. date: date or YYYY-MM-DD"""
+        if isinstance(date, dt.date):
+            date = date.isoformat()
+        return self._positions.get(f'{newspaper}_{date}')
+
+    def select(self, newspapers=None, start=None, end=None, label=None,
+               cover=None):
+        """
+        Positions of the keys of the given newspapers (default all of them)
+        between start and end (inclusive, default unbounded). label and
+        cover, when not None, filter on has_label and has_cover.
+        """
+        if newspapers is None:
+            newspapers = self.newspapers
+
+        selected = []
+        for newspaper in newspapers:
+            if newspaper not in self._blocks:
+                continue
+            first, last = self._blocks[newspaper]
+            # Dates are descending within a block
+            neg_days = -self.days[first:last].astype(np.int64)
+            if end is not None:
+                first_in = np.searchsorted(neg_days,
+                                           -to_day(end).astype(np.int64))
+            else:
+                first_in = 0
+            if start is not None:
+                last_in = np.searchsorted(neg_days,
+                                          -to_day(start).astype(np.int64),
+                                          side='right')
+            else:
+                last_in = len(neg_days)
+            selected.append(np.arange(first + first_in, first + last_in))
+
+        positions = np.concatenate(selected + [np.zeros(0, np.int64)])
+        if label is not None:
+            positions = positions[self.has_label[positions] == label]
+        if cover is not None:
+            positions = positions[self.has_cover[positions] == cover]
+        return positions
+
+    def paired(self):
+        """Positions of the keys with both a label and a cover"""
+        return np.flatnonzero(self.has_label & self.has_cover)
+
+    def labels_without_covers(self):
+        missing = np.flatnonzero(self.has_label & ~self.has_cover)
+        return [self.keys[i] for i in missing]
+
+    def covers_without_labels(self):
+        missing = np.flatnonzero(self.has_cover & ~self.has_label)
+        return [self.keys[i] for i in missing]
+
+    def label_path(self, idx):
+        return os.path.join(self.root, 'labels', self.keys[idx] + '.xml')
+
+    def cover_path(self, idx):
+        return os.path.join(self.root, 'covers', self.keys[idx] + '.jpeg')
+
+    def __len__(self):
+        return len(self.keys)
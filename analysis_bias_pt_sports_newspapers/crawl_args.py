@@ -0,0 +1,21 @@
+"""
+Command line arguments of the crawler, declared without importing
+crawl_covers so that the analysis command line stays light.
+"""
+import datetime
+
+
+def _parse_date(date_str):
+    return datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+
+
+def add_crawl_arguments(parser):
+    parser.add_argument('-o', '--out', type=str, default='./data/covers/')
+    parser.add_argument('--start', type=_parse_date,
+                        default=datetime.date(2019, 1, 1))
+    parser.add_argument('--end', type=_parse_date,
+                        default=datetime.date(2019, 12, 31))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=5.0,
+                        help='Max requests per second to each host')
+    parser.add_argument('--retries', type=int, default=3)
@@ -2,9 +2,20 @@ import os
 from multiprocessing import Pool
 import functools
 import datetime
+import asyncio
+import hashlib
+import json
+import re
+import tempfile
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 from enum import Enum
-import requests
-import bs4
+
+BASE_URL = 'https://24.sapo.pt/jornais/desporto'
+
+_PICTURE_START_RE = re.compile(r'<picture\b', re.IGNORECASE)
+_PICTURE_END_RE = re.compile(r'</picture\s*>', re.IGNORECASE)
 
 
 class Newspaper(Enum):
@@ -85,12 +96,14 @@ class Crawler(object):
     @staticmethod
     def _crawl(day: datetime.date, newspaper, resolution, out_dir):
         filename = f'{newspaper.name}_{day}'
+        import requests
         print(f'{filename}: Downloading')
         response = requests.get(Crawler.url(newspaper, day))
         if response.status_code != 200:
             print(f'{filename}: Error getting page')
             return
 
+        import bs4
         soup = bs4.BeautifulSoup(response.text, 'html.parser')
         picture_tag = soup.findAll('picture')[0]
         if not picture_tag:
@@ -103,18 +116,18 @@ class Crawler(object):
             print(f'{filename}: No image url found')
             return
 
-        with open(os.path.join(out_dir, filename + '.jpeg'), 'wb') as f:
-            f.write(requests.get(image_url).content)
-            f.close()
+        atomic_write(os.path.join(out_dir, filename + '.jpeg'),
+                     requests.get(image_url).content)
 
         return (filename, image_url)
 
     @staticmethod
     def url(newspaper: Newspaper, date: datetime.date):
-        return f'https://24.sapo.pt/jornais/desporto/{newspaper.value}/{date.isoformat()}'
+        return f'{BASE_URL}/{newspaper.value}/{date.isoformat()}'
 
     @staticmethod
     def filter_image_sources_by_resolution(pic_tag, res: Resolution):
+        import bs4
         for pc in pic_tag.descendants:
             not_html_tag = type(pc) != bs4.element.Tag
             if not_html_tag:
@@ -127,29 +140,324 @@ class Crawler(object):
         return None
 
 
-def main():
-    import argparse
-    import os
+class _PictureSourcesParser(HTMLParser):
+    def __init__(self):
+        super(_PictureSourcesParser, self).__init__(convert_charrefs=True)
+        self.sources = []
 
-    parser = argparse.ArgumentParser(description='')
-    parser.add_argument('-o', '--out', type=str, default='./data/covers/')
-    args = parser.parse_args()
+    def handle_starttag(self, tag, attrs):
+        if tag == 'source':
+            self.sources.append(dict(attrs))
+
+
+def _first_srcset_url(srcset):
+    url = srcset.split(',')[0].strip().split(' ')[0]
+    # The pages use protocol relative urls
+    return 'http:' + url if url.startswith('//') else url
+
+
+def picture_sources(html):
+    """The attributes of the <source> tags of the first <picture> in html.
+
+    Only the first <picture> element is parsed, the rest of the page is
+    skipped with a plain string search.
+    """
+    start = _PICTURE_START_RE.search(html)
+    if start is None:
+        return None
+    end = _PICTURE_END_RE.search(html, start.end())
+    end = end.end() if end is not None else len(html)
+
+    parser = _PictureSourcesParser()
+    parser.feed(html[start.start():end])
+    parser.close()
+    return parser.sources
+
+
+def extract_image_urls(html, image_type='image/jpeg'):
+    """Maps every Resolution available in the first <picture> of html to the
+    url of its cover, in a single pass over the page.
+
+    """
+    urls = {}
+    for source in picture_sources(html) or []:
+        if source.get('type') != image_type:
+            continue
+        srcset = source.get('data-srcset') or source.get('srcset') or ''
+        for res in Resolution:
+            if res not in urls and res.html_str() in srcset:
+                urls[res] = _first_srcset_url(srcset)
+    return urls
+
+
+def extract_image_url(html, res, image_type='image/jpeg'):
+    """The url of the cover in the given resolution, or None.
+
+    If no source has that resolution, falls back to the first one of
+    image_type, like Crawler.filter_image_sources_by_resolution does.
+    """
+    urls = extract_image_urls(html, image_type)
+    if res in urls:
+        return urls[res]
 
+    for source in picture_sources(html) or []:
+        if source.get('type') == image_type and source.get('data-srcset'):
+            return _first_srcset_url(source['data-srcset'])
+    return None
+
+
+def atomic_write(path, content):
+    """Writes content to a temporary file next to path and renames it, so
+    that path is either missing or complete, never truncated.
+
+    """
+    out_dir, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir or '.',
+                                    prefix='.' + name,
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class CrawlManifest(object):
+    """Status of every crawled (newspaper, day), saved as JSON in the output
+    directory
+
+    Each entry is keyed by the cover filename (<newspaper>_<day>) and holds
+    the status ('done' or 'failed'), the image url, size and sha256 of the
+    downloaded cover, or the error of the last attempt.
+    """
+    FILENAME = 'crawl_manifest.json'
+
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, CrawlManifest.FILENAME)
+        self.out_dir = out_dir
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def is_done(self, filename):
+        """True if the cover was downloaded and is still intact on disk"""
+        entry = self.entries.get(filename)
+        if entry is None or entry['status'] != 'done':
+            return False
+        try:
+            size = os.path.getsize(os.path.join(self.out_dir,
+                                                filename + '.jpeg'))
+        except FileNotFoundError:
+            return False
+        return size == entry['size']
+
+    def record_done(self, filename, image_url, content):
+        self.entries[filename] = {
+            'status': 'done',
+            'image_url': image_url,
+            'size': len(content),
+            'sha256': hashlib.sha256(content).hexdigest(),
+        }
+
+    def record_failed(self, filename, error):
+        self.entries[filename] = {'status': 'failed', 'error': error}
+
+    def save(self):
+        atomic_write(self.path,
+                     json.dumps(self.entries, indent=1, sort_keys=True).encode())
+
+
+class RetryableError(Exception):
+    pass
+
+
+class HostRateLimiter(object):
+    """Spaces the requests to each host by at least 1 / rate seconds.
+
+    """
+    def __init__(self, rate):
+        self._interval = 1.0 / rate if rate else 0.0
+        self._next_slot = {}
+
+    async def wait(self, url):
+        host = urlsplit(url).netloc
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncCrawler(object):
+    """Crawls the covers of many newspapers in a single asyncio event loop
+
+    All requests share one pooled HTTP session. At most `concurrency`
+    requests are in flight, each host gets at most `rate` requests per
+    second, and failed requests are retried with exponential backoff.
+
+    Progress is kept in a CrawlManifest in the output directory: days whose
+    cover was already downloaded are skipped, so a re-run only fetches the
+    new and the previously failed days.
+    """
+    def __init__(self,
+                 newspapers=tuple(Newspaper),
+                 start=datetime.date.today(),
+                 end=datetime.date.today(),
+                 resolution=Resolution.R1050x1305,
+                 concurrency=8,
+                 rate=5.0,
+                 timeout=(5, 30),
+                 retries=3,
+                 backoff=0.5,
+                 base_url=BASE_URL):
+        super(AsyncCrawler, self).__init__()
+        if start > end:
+            raise ValueError('Mispecified time range: start later than end.')
+
+        self.newspapers = newspapers
+        self.start = start
+        self.end = end
+        self.resolution = resolution
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.base_url = base_url
+
+    def url(self, newspaper: Newspaper, date: datetime.date):
+        return f'{self.base_url}/{newspaper.value}/{date.isoformat()}'
+
+    def crawl(self, out_dir='.'):
+        """Crawls every (newspaper, day). Returns the list of results of
+        _crawl_day.
+
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.crawl_async(out_dir))
+        finally:
+            loop.close()
+
+    async def crawl_async(self, out_dir='.'):
+        import requests
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=len(self.newspapers),
+            pool_maxsize=self.concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        self._session = session
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._limiter = HostRateLimiter(self.rate)
+        self._executor = ThreadPoolExecutor(self.concurrency)
+        self._manifest = CrawlManifest(out_dir)
+        self._unsaved = 0
+        try:
+            tasks = [
+                self._crawl_day(newspaper, day, out_dir)
+                for day in _days_range(self.start, self.end)
+                for newspaper in self.newspapers
+                if not self._manifest.is_done(f'{newspaper.name}_{day}')
+            ]
+            return await asyncio.gather(*tasks)
+        finally:
+            self._manifest.save()
+            self._executor.shutdown(wait=True)
+            session.close()
+
+    def _record(self, filename, image_url, content, error):
+        if error is None:
+            self._manifest.record_done(filename, image_url, content)
+        else:
+            self._manifest.record_failed(filename, error)
+
+        # Save now and then so an interrupted crawl keeps most of its progress
+        self._unsaved += 1
+        if self._unsaved >= 50:
+            self._manifest.save()
+            self._unsaved = 0
+
+    async def _get(self, url):
+        import requests
+        loop = asyncio.get_event_loop()
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    await self._limiter.wait(url)
+                    response = await loop.run_in_executor(
+                        self._executor,
+                        functools.partial(self._session.get,
+                                          url,
+                                          timeout=self.timeout))
+                # Server errors and throttling are worth retrying, other
+                # errors (e.g. no cover on that day) are not.
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise RetryableError(f'HTTP {response.status_code}')
+                return response
+            except (requests.ConnectionError, requests.Timeout,
+                    RetryableError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2**attempt)
+
+    async def _crawl_day(self, newspaper, day, out_dir):
+        """Returns (filename, image_url, error), error is None on success.
+
+        """
+        filename = f'{newspaper.name}_{day}'
+        try:
+            response = await self._get(self.url(newspaper, day))
+            if response.status_code != 200:
+                raise RuntimeError('Error getting page')
+
+            image_url = extract_image_url(response.text, self.resolution)
+            if not image_url:
+                raise RuntimeError('No image url found')
+
+            response = await self._get(image_url)
+            if response.status_code != 200:
+                raise RuntimeError('Error getting image')
+            await asyncio.get_event_loop().run_in_executor(
+                self._executor, atomic_write,
+                os.path.join(out_dir, filename + '.jpeg'), response.content)
+        except Exception as e:
+            print(f'{filename}: {e}')
+            self._record(filename, None, None, str(e))
+            return (filename, None, str(e))
+
+        print(f'{filename}: Downloaded')
+        self._record(filename, image_url, response.content, None)
+        return (filename, image_url, None)
+
+
+def crawl_from_args(args):
     os.makedirs(args.out, exist_ok=True)
 
-    crawler = Crawler()
-    crawler.newspaper = Newspaper.Abola
-    today = datetime.date.today()
-    crawler.timerange(start=datetime.date(2019, 1, 1), end=datetime.date(2019, 12, 31))
+    crawler = AsyncCrawler(newspapers=tuple(Newspaper),
+                           start=args.start,
+                           end=args.end,
+                           concurrency=args.concurrency,
+                           rate=args.rate,
+                           retries=args.retries)
     crawler.crawl(out_dir=args.out)
 
-    crawler.newspaper = Newspaper.Record
-    crawler.timerange(start=datetime.date(2019, 1, 1), end=datetime.date(2019, 12, 31))
-    crawler.crawl(out_dir=args.out)
 
-    crawler.newspaper = Newspaper.Ojogo
-    crawler.timerange(start=datetime.date(2019, 1, 1), end=datetime.date(2019, 12, 31))
-    crawler.crawl(out_dir=args.out)
+def main():
+    import argparse
+    from crawl_args import add_crawl_arguments
+
+    parser = argparse.ArgumentParser(description='')
+    add_crawl_arguments(parser)
+    crawl_from_args(parser.parse_args())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+"""
+A local stand-in for banca sapo, to exercise the crawler without the
+network. Pages follow the layout of the real ones:
+
+    <base_url>/<newspaper id>/<date>   page with the <picture> of the cover
+    /covers/<newspaper>_<date>.jpeg    the cover itself
+
+Usage:
+
+    with FixtureServer() as server:
+        crawler = AsyncCrawler(base_url=server.base_url, ...)
+"""
+import io
+import re
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from crawl_covers import Newspaper, Resolution
+
+PAGE_PATH_RE = re.compile(r'^/jornais/desporto/(\d+)/(\d{4}-\d{2}-\d{2})$')
+COVER_PATH_RE = re.compile(r'^/covers/(\w+)_(\d{4}-\d{2}-\d{2})\.jpeg')
+
+
+def cover_page(host, newspaper, date):
+    """
+    HTML page of the cover of newspaper on date, with one <source> per
+    resolution (webp first, then jpeg) and many unrelated tags around it.
+    """
+    filler = ''.join(
+        f'<div class="news"><a href="/n/{i}"><span>Noticia {i}</span></a>'
+        f'<img src="//{host}/thumb/{i}.jpg"></div>' for i in range(200))
+    sources = []
+    for image_type, ext in (('image/webp', 'webp'), ('image/jpeg', 'jpeg')):
+        for res in sorted(Resolution, key=lambda r: -r.width):
+            url = (f'//{host}/covers/{newspaper.name}_{date}.{ext}?'
+                   f'{res.html_str()}')
+            sources.append(f'<source type="{image_type}" '
+                           f'media="(min-width: {res.width}px)" '
+                           f'srcset="data:image/gif;base64,R0lGOD" '
+                           f'data-srcset="{url}">')
+    return ('<!DOCTYPE html><html><head><title>Banca</title></head><body>'
+            f'<header>{filler}</header><main><picture>{"".join(sources)}'
+            f'<img alt="{newspaper.name}" src="//{host}/placeholder.gif">'
+            f'</picture></main><footer>{filler}</footer></body></html>')
+
+
+def cover_image(newspaper, date, size=(32, 40)):
+    """A small, valid JPEG that differs per newspaper and date"""
+    from PIL import Image
+
+    color = zlib.crc32(f'{newspaper.name}_{date}'.encode()).to_bytes(4, 'big')
+    buf = io.BytesIO()
+    Image.new('RGB', size, tuple(color[:3])).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+
+        # Fail the first requests to a path, to exercise the retries
+        failures = server.fail_first.get(self.path, 0)
+        if failures > 0:
+            server.fail_first[self.path] = failures - 1
+            self._reply(503, b'', 'text/plain')
+            return
+
+        match = PAGE_PATH_RE.match(self.path)
+        if match:
+            newspaper = Newspaper(int(match.group(1)))
+            if match.group(2) in server.missing_days:
+                self._reply(404, b'', 'text/plain')
+                return
+            page = cover_page(self.headers['Host'], newspaper, match.group(2))
+            self._reply(200, page.encode(), 'text/html')
+            return
+
+        match = COVER_PATH_RE.match(self.path)
+        if match:
+            image = cover_image(Newspaper[match.group(1)], match.group(2))
+            self._reply(200, image, 'image/jpeg')
+            return
+
+        self._reply(404, b'', 'text/plain')
+
+    def _reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FixtureServer(object):
+    """Serves fixture pages and covers on localhost in a background thread
+
+    missing_days: dates (YYYY-MM-DD) without a cover, answered with 404.
+    fail_first: {path: n} answers the first n requests to path with 503.
+    """
+    def __init__(self, missing_days=(), fail_first=None):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.requests = []
+        self._server.missing_days = set(missing_days)
+        self._server.fail_first = dict(fail_first or {})
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/jornais/desporto'
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,361 @@
+"""
+Streaming ingest of the daily covers and games, keeping the statistics of
+analysis.py up to date without recomputing them over the whole history:
+- club counts: covers of each newspaper highlighting each club
+- monthly counts: the same, per month, for the monthly means
+- next day tallies: games of each club by outcome, and how many of them
+  were followed the next day by a cover of each newspaper highlighting it
+
+Each new cover or game updates these in place, in time independent of the
+length of the history. The running state is pickled between runs. Covers
+and games may arrive in any order, and a cover or game ingested again
+replaces the previous one.
+
+Run from the main folder, e.g. after crawling and labeling a new day
+
+    python daily_ingest.py ingest data/labels/Abola_2020-01-02.xml \\
+        --games data/games_data.csv --since 2020-01-01
+    python daily_ingest.py verify
+"""
+import os
+import datetime as dt
+import numpy as np
+import pandas as pd
+from annotation_store import flatten_parsed_labels
+from cover_cube import CHANNELS, COVERS
+from cover_metrics import cover_metrics, pack_label_masks, MAX_AREA_TOL
+from covers_dataset import parse_label_file, get_file_path_newspaper, get_file_path_date
+from next_day import OUTCOMES, ANALYSIS_CLUBS, club_team_name
+from utils import Clubs, to_day
+
+STATE_VERSION = 1
+NEXT_DAY_LAG = 1
+
+
+def label_mask(label_path, max_area_tol=MAX_AREA_TOL):
+    """
+    Highlighted_Mask of the cover of a label file, or None if the cover has
+    no boxes (e.g. on holidays), like the covers skipped by covers_frame.
+    """
+    arrays = flatten_parsed_labels([parse_label_file(label_path)])
+    metrics = cover_metrics(arrays, max_area_tol)
+    if not metrics['has_boxes'][0]:
+        return None
+    return int(pack_label_masks(metrics['highlighted'])[0])
+
+
+def mask_channels(mask):
+    """(CHANNELS,) counts of a cover, as in cover_cube"""
+    channels = np.zeros(len(CHANNELS), dtype=np.int64)
+    for i, club in enumerate(Clubs):
+        channels[i] = (mask >> club.id) & 1
+    channels[COVERS] = 1
+    return channels
+
+
+def game_outcomes(team_score, other_score):
+    """Indices in OUTCOMES of a game of a team"""
+    if team_score > other_score:
+        return [OUTCOMES.index('win')]
+    if team_score == other_score:
+        return [OUTCOMES.index('non-win'), OUTCOMES.index('draw')]
+    return [OUTCOMES.index('non-win'), OUTCOMES.index('loss')]
+
+
+class DailyAggregates(object):
+    """
+    Running statistics of the covers and games ingested so far.
+
+    - covers: {(newspaper, date): Highlighted_Mask}
+    - games: {date: {(home_team, away_team): (home_score, away_score)}}
+    - club_counts: {newspaper: (CHANNELS,) counts}
+    - monthly_counts: {(newspaper, 'YYYY-MM'): (CHANNELS,) counts}
+    - events: (OUTCOMES, ANALYSIS_CLUBS) games of each club
+    - highlighted: {newspaper: (OUTCOMES, ANALYSIS_CLUBS)} of those games
+      followed by a cover of the newspaper highlighting the club
+    """
+    FIELDS = ('covers', 'games', 'club_counts', 'monthly_counts', 'events',
+              'highlighted')
+
+    def __init__(self):
+        self.covers = {}
+        self.games = {}
+        self.club_counts = {}
+        self.monthly_counts = {}
+        self.events = np.zeros((len(OUTCOMES), len(ANALYSIS_CLUBS)),
+                               dtype=np.int64)
+        self.highlighted = {}
+        self._teams = [club_team_name(c) for c in ANALYSIS_CLUBS]
+
+    @staticmethod
+    def load(path):
+        """The saved state, or an empty one if missing or outdated"""
+        aggregates = DailyAggregates()
+        try:
+            state = pd.read_pickle(path)
+        except FileNotFoundError:
+            return aggregates
+        if isinstance(state, dict) and state.get('version') == STATE_VERSION:
+            for name in DailyAggregates.FIELDS:
+                setattr(aggregates, name, state[name])
+        return aggregates
+
+    def save(self, path):
+        # Plain containers only, so that the pickle does not depend on
+        # where this module was imported from
+        state = {name: getattr(self, name) for name in self.FIELDS}
+        state['version'] = STATE_VERSION
+        tmp_path = path + '.tmp'
+        pd.to_pickle(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _club_games(self, day):
+        """(club index, outcome index) of every game of the clubs on day"""
+        res = []
+        for (home, away), (home_score, away_score) in self.games.get(
+                day, {}).items():
+            for team, score, other in ((home, home_score, away_score),
+                                       (away, away_score, home_score)):
+                if team in self._teams:
+                    club_idx = self._teams.index(team)
+                    res.extend((club_idx, o)
+                               for o in game_outcomes(score, other))
+        return res
+
+    def _update_cover(self, newspaper, day, mask, sign):
+        channels = sign * mask_channels(mask)
+        if newspaper not in self.club_counts:
+            self.club_counts[newspaper] = np.zeros(len(CHANNELS), np.int64)
+            self.highlighted[newspaper] = np.zeros_like(self.events)
+        self.club_counts[newspaper] += channels
+        month_key = (newspaper, day.strftime('%Y-%m'))
+        if month_key not in self.monthly_counts:
+            self.monthly_counts[month_key] = np.zeros(len(CHANNELS), np.int64)
+        self.monthly_counts[month_key] += channels
+
+        game_day = day - dt.timedelta(days=NEXT_DAY_LAG)
+        for club_idx, outcome_idx in self._club_games(game_day):
+            if (mask >> ANALYSIS_CLUBS[club_idx].id) & 1:
+                self.highlighted[newspaper][outcome_idx, club_idx] += sign
+
+    def _update_game(self, day, home, away, home_score, away_score, sign):
+        cover_day = day + dt.timedelta(days=NEXT_DAY_LAG)
+        for team, score, other in ((home, home_score, away_score),
+                                   (away, away_score, home_score)):
+            if team not in self._teams:
+                continue
+            club_idx = self._teams.index(team)
+            club_id = ANALYSIS_CLUBS[club_idx].id
+            for outcome_idx in game_outcomes(score, other):
+                self.events[outcome_idx, club_idx] += sign
+                for newspaper in self.highlighted:
+                    mask = self.covers.get((newspaper, cover_day))
+                    if mask is not None and (mask >> club_id) & 1:
+                        self.highlighted[newspaper][outcome_idx,
+                                                    club_idx] += sign
+
+    def add_cover(self, newspaper, date, mask):
+        """
+        Ingests the Highlighted_Mask of the cover of newspaper (lower case
+        name) on date. A mask of None removes the cover.
+        """
+        day = to_day(date).item()
+        key = (newspaper, day)
+        old_mask = self.covers.pop(key, None)
+        if old_mask is not None:
+            self._update_cover(newspaper, day, old_mask, -1)
+        if mask is not None:
+            self.covers[key] = int(mask)
+            self._update_cover(newspaper, day, int(mask), 1)
+
+    def add_label_file(self, label_path, max_area_tol=MAX_AREA_TOL):
+        """Ingests the cover of a labels/<Newspaper>_<date>.xml file"""
+        self.add_cover(
+            get_file_path_newspaper(label_path).lower(),
+            get_file_path_date(label_path), label_mask(label_path,
+                                                       max_area_tol))
+
+    def add_game(self, date, home_team, away_team, home_score, away_score):
+        day = to_day(date).item()
+        day_games = self.games.setdefault(day, {})
+        old = day_games.pop((home_team, away_team), None)
+        if old is not None:
+            self._update_game(day, home_team, away_team, *old, -1)
+        day_games[(home_team, away_team)] = (int(home_score), int(away_score))
+        self._update_game(day, home_team, away_team, int(home_score),
+                          int(away_score), 1)
+
+    def add_games_df(self, games_df):
+        """Ingests the games of a frame of analysis.games_data_to_pandas"""
+        for row in games_df.itertuples(index=False):
+            self.add_game(row.Date, row.Home_Team, row.Away_Team,
+                          row.Home_Score, row.Away_Score)
+
+    def last_game_day(self):
+        return max(self.games) if self.games else None
+
+    def club_counts_df(self):
+        """Covers of each newspaper (rows) highlighting each club"""
+        return pd.DataFrame.from_dict(self.club_counts,
+                                      orient='index',
+                                      columns=CHANNELS).sort_index()
+
+    def monthly_means(self):
+        """
+        Share of the covers of each newspaper and month highlighting each
+        club, indexed by (Newspaper, Month)
+        """
+        counts = pd.DataFrame.from_dict(self.monthly_counts,
+                                        orient='index',
+                                        columns=CHANNELS)
+        counts.index = pd.MultiIndex.from_tuples(counts.index,
+                                                 names=['Newspaper', 'Month'])
+        counts = counts[counts['covers'] > 0].sort_index()
+        return counts[CHANNELS[:COVERS]].div(counts['covers'], axis=0)
+
+    def next_day_table(self, newspapers=None, outcomes=('win', 'non-win')):
+        """Same layout as next_day.next_day_table, for the lag of 1 day"""
+        if newspapers is None:
+            newspapers = sorted(self.highlighted)
+        rows = []
+        for newspaper in newspapers:
+            highlighted = self.highlighted.get(newspaper,
+                                               np.zeros_like(self.events))
+            for outcome in outcomes:
+                o = OUTCOMES.index(outcome)
+                for c, club in enumerate(ANALYSIS_CLUBS):
+                    rows.append({
+                        'Newspaper': newspaper,
+                        'Club': club.name.lower(),
+                        'Outcome': outcome,
+                        'Lag': NEXT_DAY_LAG,
+                        'Events': self.events[o, c],
+                        'Highlighted': highlighted[o, c],
+                    })
+        table = pd.DataFrame(rows)
+        table['Rate'] = table['Highlighted'] / table['Events']
+        return table
+
+
+def full_recompute(covers_df, games_df):
+    """
+    The statistics of DailyAggregates computed from scratch over the whole
+    covers frame and games, with the batch code of analysis.py:
+    (club counts, monthly means, next day table).
+    """
+    from cover_cube import CoverCube
+    from next_day import next_day_table
+
+    cube = CoverCube.from_covers_df(covers_df)
+    club_counts = pd.DataFrame(cube.counts(),
+                               index=cube.newspapers,
+                               columns=CHANNELS).sort_index()
+
+    starts, counts = cube.period_counts('month')
+    months = pd.DatetimeIndex(starts).strftime('%Y-%m')
+    frames = []
+    for n_idx, newspaper in enumerate(cube.newspapers):
+        frames.append(
+            pd.DataFrame(counts[:, n_idx],
+                         index=pd.MultiIndex.from_product(
+                             [[newspaper], months],
+                             names=['Newspaper', 'Month']),
+                         columns=CHANNELS))
+    monthly = pd.concat(frames)
+    monthly = monthly[monthly['covers'] > 0].sort_index()
+    monthly = monthly[CHANNELS[:COVERS]].div(monthly['covers'], axis=0)
+
+    table = next_day_table(covers_df,
+                           games_df,
+                           newspapers=cube.newspapers,
+                           lags=(NEXT_DAY_LAG, ))
+    return club_counts, monthly, table
+
+
+def verify(aggregates, covers_df, games_df):
+    """
+    Compares the running statistics with a full recompute. Returns the
+    names of the statistics that differ (empty if all match).
+    """
+    club_counts, monthly, table = full_recompute(covers_df, games_df)
+    running_table = aggregates.next_day_table(newspapers=sorted(
+        covers_df['Newspaper'].unique()))
+    key = ['Newspaper', 'Club', 'Outcome', 'Lag']
+    table = table.sort_values(key).reset_index(drop=True)
+    running_table = running_table.sort_values(key).reset_index(drop=True)
+
+    differences = []
+    if not club_counts.equals(aggregates.club_counts_df().astype(
+            club_counts.dtypes)):
+        differences.append('club counts')
+    running_monthly = aggregates.monthly_means()
+    if not (running_monthly.index.equals(monthly.index)
+            and np.allclose(running_monthly.values, monthly.values)):
+        differences.append('monthly means')
+    if not (running_table[key].equals(table[key]) and np.array_equal(
+            running_table[['Events', 'Highlighted']].values,
+            table[['Events', 'Highlighted']].values)):
+        differences.append('next day tallies')
+    return differences
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--state',
+                        type=str,
+                        default='./data/daily_state.pkl',
+                        help='pickle of the running statistics')
+    commands = parser.add_subparsers(dest='command')
+
+    ingest = commands.add_parser('ingest', help='ingest new covers and games')
+    ingest.add_argument('labels', nargs='*', help='label files of new covers')
+    ingest.add_argument('--games', type=str, default=None,
+                        help='games_data.csv with the new games')
+    ingest.add_argument('--since', type=str, default=None,
+                        help='only read the games from this date on '
+                        '(default: the last ingested game day)')
+
+    verify_parser = commands.add_parser(
+        'verify', help='compare the running statistics with a full recompute')
+    verify_parser.add_argument('--data', type=str, default='./data/')
+    verify_parser.add_argument('--start', type=str, default=None)
+    verify_parser.add_argument('--end', type=str, default=None)
+    args = parser.parse_args()
+
+    aggregates = DailyAggregates.load(args.state)
+    if args.command == 'ingest':
+        from analysis import games_data_to_pandas
+
+        for label_path in args.labels:
+            aggregates.add_label_file(label_path)
+        if args.games is not None:
+            since = args.since and to_day(args.since).item()
+            if since is None:
+                since = aggregates.last_game_day()
+            aggregates.add_games_df(
+                games_data_to_pandas(args.games, start=since, end=None))
+        aggregates.save(args.state)
+        print(aggregates.club_counts_df())
+        print(aggregates.next_day_table().to_string(
+            index=False, formatters={'Rate': '{:.0%}'.format}))
+    elif args.command == 'verify':
+        from analysis import update_covers_df, games_data_to_pandas
+
+        covers_df = update_covers_df(args.data)
+        games_df = games_data_to_pandas(
+            os.path.join(args.data, 'games_data.csv'),
+            start=args.start and to_day(args.start).item(),
+            end=args.end and to_day(args.end).item())
+        differences = verify(aggregates, covers_df, games_df)
+        if differences:
+            print('Differences in: ' + ', '.join(differences))
+        else:
+            print('The running statistics match a full recompute')
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+The labels and covers of a dataset packed in one archive file (or a few
+shards), read in place through a memory map.
+
+Layout of each file:
+
+    MAGIC
+    the bytes of every label file and cover, one after the other
+    index: JSON {"shard": i, "shards": n,
+                 "entries": {key: [label offset, label size,
+                                   cover offset, cover size]}}
+    footer: index offset and size (little endian uint64), MAGIC
+
+where key is <newspaper>_<date> and a missing file has offset -1. Every
+shard records the number of shards of its pack, so that the shards left
+by an older pack are detected.
+
+Run from the main folder, e.g.
+
+    python dataset_archive.py pack ./data/ ./data/dataset.pack
+    python dataset_archive.py unpack ./data/dataset.pack /tmp/data/
+
+and read with CoversDataset(archive='./data/dataset.pack').
+"""
+import os
+import glob
+import io
+import json
+import mmap
+import struct
+import numpy as np
+from covers_index import CoversIndex, KEY_RE, scan_keys
+
+MAGIC = b'CVRPACK2'
+FOOTER = struct.Struct('<QQ8s')
+KINDS = (('labels', '.xml'), ('covers', '.jpeg'))
+
+
+def shard_paths(path, shards):
+    if shards == 1:
+        return [path]
+    return [f'{path}.{i:05d}' for i in range(shards)]
+
+
+def _existing_shards(path):
+    """The path.NNNNN files next to path"""
+    return sorted(p for p in glob.glob(glob.escape(path) + '.*')
+                  if p[len(path) + 1:].isdigit())
+
+
+def pack(root, path, shards=1):
+    """
+    Packs the labels/*.xml and covers/*.jpeg of root into path, or into
+    path.00000, path.00001, ... with shards > 1. Each key is in one shard,
+    with its label and cover. The files of an earlier pack to the same path
+    are removed. Returns the number of keys.
+    """
+    files = {}
+    for kind, (directory, ext) in enumerate(KINDS):
+        for key in scan_keys(os.path.join(root, directory), ext):
+            files.setdefault(key, [None, None])[kind] = os.path.join(
+                root, directory, key + ext)
+    keys = sorted(files, key=lambda k: KEY_RE.match(k).groups(),
+                  reverse=True)
+
+    # Contiguous runs of keys, so that a shard holds whole date ranges
+    per_shard = -(-len(keys) // shards) if keys else 0
+    paths = shard_paths(path, shards)
+    for shard, shard_path in enumerate(paths):
+        shard_keys = keys[shard * per_shard:(shard + 1) * per_shard]
+        tmp_path = shard_path + '.tmp'
+        index = {}
+        with open(tmp_path, 'wb') as out:
+            out.write(MAGIC)
+            for key in shard_keys:
+                entry = []
+                for file_path in files[key]:
+                    if file_path is None:
+                        entry.extend([-1, 0])
+                        continue
+                    with open(file_path, 'rb') as f:
+                        content = f.read()
+                    entry.extend([out.tell(), len(content)])
+                    out.write(content)
+                index[key] = entry
+
+            index_bytes = json.dumps({
+                'shard': shard,
+                'shards': shards,
+                'entries': index
+            }).encode()
+            index_offset = out.tell()
+            out.write(index_bytes)
+            out.write(FOOTER.pack(index_offset, len(index_bytes), MAGIC))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, shard_path)
+
+    for stale_path in [path] + _existing_shards(path):
+        if stale_path not in paths and os.path.exists(stale_path):
+            os.remove(stale_path)
+    return len(keys)
+
+
+class DatasetArchive(object):
+    """
+    Random access to the labels and covers of a packed archive, without
+    extracting it. label_bytes and cover_bytes are views of the memory map.
+    """
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self._open()
+
+    def _open(self):
+        self._files = []
+        self._maps = []
+        self.entries = {}
+        try:
+            for shard, path in enumerate(self.paths):
+                self._open_shard(shard, path)
+        except BaseException:
+            self.close()
+            raise
+
+    def _open_shard(self, shard, path):
+        f = open(path, 'rb')
+        self._files.append(f)
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(m)
+        if m[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a dataset archive')
+        index_offset, index_size, magic = FOOTER.unpack(m[len(m) -
+                                                          FOOTER.size:])
+        if magic != MAGIC:
+            raise ValueError(f'{path} is truncated')
+        index = json.loads(bytes(m[index_offset:index_offset + index_size]))
+
+        # Shards of different packs, e.g. left over by a pack with more
+        # shards, must not be mixed
+        if (index['shard'], index['shards']) != (shard, len(self.paths)):
+            raise ValueError(f'{path} is shard {index["shard"]} of '
+                             f'{index["shards"]}, not {shard} of '
+                             f'{len(self.paths)}')
+        for key, entry in index['entries'].items():
+            if key in self.entries:
+                raise ValueError(f'{key} is in more than one shard')
+            self.entries[key] = (shard, ) + tuple(entry)
+
+    @staticmethod
+    def open(path):
+        """The archive at path, or its shards path.00000, ..."""
+        if os.path.exists(path):
+            return DatasetArchive([path])
+        paths = _existing_shards(path)
+        if not paths:
+            raise FileNotFoundError(path)
+        return DatasetArchive(paths)
+
+    # The memory maps are reopened in other processes
+    def __getstate__(self):
+        return {'paths': self.paths}
+
+    def __setstate__(self, state):
+        self.paths = state['paths']
+        self._open()
+
+    def close(self):
+        for m in self._maps:
+            m.close()
+        for f in self._files:
+            f.close()
+        self._maps, self._files = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _bytes(self, key, kind):
+        entry = self.entries[key]
+        offset, size = entry[1 + 2 * kind], entry[2 + 2 * kind]
+        if offset < 0:
+            raise KeyError(f'{key} has no {KINDS[kind][0][:-1]}')
+        return memoryview(self._maps[entry[0]])[offset:offset + size]
+
+    def label_bytes(self, key):
+        return self._bytes(key, 0)
+
+    def cover_bytes(self, key):
+        return self._bytes(key, 1)
+
+    def label_file(self, key):
+        """The label file of key, as a file object"""
+        return io.BytesIO(self.label_bytes(key))
+
+    def cover_file(self, key):
+        return io.BytesIO(self.cover_bytes(key))
+
+    def index(self):
+        """CoversIndex of the keys of the archive, rooted at the archive"""
+        keys = sorted(self.entries,
+                      key=lambda k: KEY_RE.match(k).groups(),
+                      reverse=True)
+        has_label = np.array([self.entries[k][1] >= 0 for k in keys],
+                             dtype=bool)
+        has_cover = np.array([self.entries[k][3] >= 0 for k in keys],
+                             dtype=bool)
+        return CoversIndex(self.paths[0], keys, has_label, has_cover)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def unpack(path, out_dir):
+    """Extracts an archive back to out_dir/labels and out_dir/covers"""
+    with DatasetArchive.open(path) as archive:
+        for directory, _ in KINDS:
+            os.makedirs(os.path.join(out_dir, directory), exist_ok=True)
+        for key, entry in archive.entries.items():
+            for kind, (directory, ext) in enumerate(KINDS):
+                if entry[1 + 2 * kind] < 0:
+                    continue
+                with open(os.path.join(out_dir, directory, key + ext),
+                          'wb') as f:
+                    f.write(archive._bytes(key, kind))
+        return len(archive)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='')
+    commands = parser.add_subparsers(dest='command')
+    pack_parser = commands.add_parser('pack', help='pack a dataset folder')
+    pack_parser.add_argument('root', type=str)
+    pack_parser.add_argument('archive', type=str)
+    pack_parser.add_argument('--shards', type=int, default=1)
+    unpack_parser = commands.add_parser('unpack', help='extract an archive')
+    unpack_parser.add_argument('archive', type=str)
+    unpack_parser.add_argument('out', type=str)
+    list_parser = commands.add_parser('list', help='list the archive keys')
+    list_parser.add_argument('archive', type=str)
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        n = pack(args.root, args.archive, args.shards)
+        print(f'Packed {n} covers into {args.archive}')
+    elif args.command == 'unpack':
+        n = unpack(args.archive, args.out)
+        print(f'Extracted {n} covers into {args.out}')
+    elif args.command == 'list':
+        with DatasetArchive.open(args.archive) as archive:
+            for key in sorted(archive.entries):
+                _, label_offset, _, cover_offset, _ = archive.entries[key]
+                print(key, 'label' if label_offset >= 0 else '-',
+                      'cover' if cover_offset >= 0 else '-')
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
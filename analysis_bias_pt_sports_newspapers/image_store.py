@@ -0,0 +1,214 @@
+"""
+Decoded covers, stored once in memory mapped shards so that they are not
+decoded again on every access.
+
+Each shard is a .npy file of shape (shard_size, height, width, 3) uint8.
+Cover i is in shard i // shard_size, row i % shard_size. With a size, the
+covers are resized to it; otherwise every cover keeps its size and is
+padded to the largest one. The index holds, per cover:
+- sizes: (n_covers, 2) width and height of the stored cover
+- orig_sizes: (n_covers, 2) width and height of the JPEG
+"""
+import os
+import glob
+import json
+import numpy as np
+from covers_dataset import sort_by_filename, get_file_path_newspaper_and_date
+from utils import files_fingerprint, start_pool
+
+IMAGE_STORE_VERSION = 1
+IMAGE_STORE_DIRNAME = 'images'
+SHARD_SIZE = 64
+
+
+def _image_paths(root):
+    return sort_by_filename(glob.glob(os.path.join(root, 'covers', '*.jpeg')))
+
+
+def _image_size(path):
+    from PIL import Image
+    # Only reads the header
+    with Image.open(path) as img:
+        return img.size
+
+
+def _decode(args):
+    path, size = args
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            img = img.convert('RGB')
+            orig_size = img.size
+            if size is not None and img.size != tuple(size):
+                img = img.resize(tuple(size), Image.BILINEAR)
+            return np.asarray(img, dtype=np.uint8), orig_size
+    except OSError as e:
+        raise OSError(f'Can not decode {path}: {e}') from e
+
+
+def _decoded_images(image_paths, size, workers):
+    jobs = [(p, size) for p in image_paths]
+    pool = start_pool(workers, len(jobs))
+    if pool is None:
+        for job in jobs:
+            yield _decode(job)
+        return
+
+    with pool:
+        for decoded in pool.imap(_decode, jobs, chunksize=8):
+            yield decoded
+
+
+def compile_images(image_paths,
+                   store_dir,
+                   size=None,
+                   shard_size=SHARD_SIZE,
+                   fingerprint=None,
+                   workers=1):
+    """
+    Decodes every cover (resized to size=(width, height) if given) into the
+    shards of store_dir.
+    """
+    if size is not None:
+        width, height = size
+    else:
+        sizes = np.array([_image_size(p) for p in image_paths],
+                         dtype=np.int32).reshape(-1, 2)
+        width, height = sizes.max(axis=0) if len(sizes) else (0, 0)
+    width, height = int(width), int(height)
+
+    os.makedirs(store_dir, exist_ok=True)
+    n = len(image_paths)
+    sizes = np.zeros((n, 2), dtype=np.int32)
+    orig_sizes = np.zeros((n, 2), dtype=np.int32)
+    shard = None
+    for idx, (img, orig_size) in enumerate(
+            _decoded_images(image_paths, size, workers)):
+        row = idx % shard_size
+        if row == 0:
+            if shard is not None:
+                shard.flush()
+            shard = np.lib.format.open_memmap(
+                os.path.join(store_dir, f'shard_{idx // shard_size:05d}.npy'),
+                mode='w+',
+                dtype=np.uint8,
+                shape=(min(shard_size, n - idx), height, width, 3))
+        h, w = img.shape[:2]
+        shard[row, :h, :w] = img
+        sizes[idx] = (w, h)
+        orig_sizes[idx] = orig_size
+    if shard is not None:
+        shard.flush()
+        del shard
+
+    np.save(os.path.join(store_dir, 'sizes.npy'), sizes)
+    np.save(os.path.join(store_dir, 'orig_sizes.npy'), orig_sizes)
+
+    # The metadata is written last: a store without it is incomplete and
+    # gets rebuilt.
+    meta = {
+        'version': IMAGE_STORE_VERSION,
+        'fingerprint': fingerprint or files_fingerprint(image_paths),
+        'size': None if size is None else list(size),
+        'shard_size': shard_size,
+        'shape': [height, width, 3],
+        'names': [get_file_path_newspaper_and_date(p) for p in image_paths],
+    }
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def rescale_target(target, width, height):
+    """
+    Target (see CoversDataset.make_target) of the cover resized to width,
+    height. The boxes are scaled from the image size of the label file.
+    """
+    sx = width / target['image_width']
+    sy = height / target['image_height']
+    if sx == 1 and sy == 1:
+        return target
+
+    target = dict(target)
+    target['boxes'] = target['boxes'] * np.array([sx, sy, sx, sy],
+                                                 dtype=np.float32)
+    target['area'] = target['area'] * np.float32(sx * sy)
+    target['image_width'] = int(width)
+    target['image_height'] = int(height)
+    return target
+
+
+class ImageStore(object):
+    """
+    Read-only, memory mapped view over the decoded covers.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.fingerprint = meta['fingerprint']
+        self.names = meta['names']
+        self.shard_size = meta['shard_size']
+        self.sizes = np.load(os.path.join(store_dir, 'sizes.npy'))
+        self.orig_sizes = np.load(os.path.join(store_dir, 'orig_sizes.npy'))
+        n_shards = -(-len(self.names) // self.shard_size)
+        self.shards = [
+            np.load(os.path.join(store_dir, f'shard_{i:05d}.npy'),
+                    mmap_mode='r') for i in range(n_shards)
+        ]
+
+    # Pickled by path: other processes reopen the memory maps instead of
+    # receiving a copy of the arrays
+    def __getstate__(self):
+        return {'store_dir': self.store_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['store_dir'])
+
+    @staticmethod
+    def is_fresh(store_dir, fingerprint, size=None):
+        try:
+            with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        return (meta.get('version') == IMAGE_STORE_VERSION
+                and meta.get('fingerprint') == fingerprint
+                and meta.get('size') == (None if size is None else list(size)))
+
+    @staticmethod
+    def open(root,
+             store_dir=None,
+             size=None,
+             shard_size=SHARD_SIZE,
+             rebuild=False,
+             workers=1):
+        """
+        Opens the image store of the dataset in root, decoding the covers
+        first if any was added, removed or modified since the last build.
+        Each size=(width, height) gets its own store.
+        """
+        if store_dir is None:
+            dirname = IMAGE_STORE_DIRNAME
+            if size is not None:
+                dirname += f'_{size[0]}x{size[1]}'
+            store_dir = os.path.join(root, dirname)
+
+        image_paths = _image_paths(root)
+        fingerprint = files_fingerprint(image_paths)
+        if rebuild or not ImageStore.is_fresh(store_dir, fingerprint, size):
+            compile_images(image_paths, store_dir, size, shard_size,
+                           fingerprint, workers)
+
+        return ImageStore(store_dir)
+
+    def image_paths(self, root):
+        return [os.path.join(root, 'covers', n + '.jpeg') for n in self.names]
+
+    def image(self, idx):
+        """(height, width, 3) uint8 view of the cover, without copies"""
+        width, height = self.sizes[idx]
+        shard = self.shards[idx // self.shard_size]
+        return shard[idx % self.shard_size, :height, :width]
+
+    def __len__(self):
+        return len(self.names)
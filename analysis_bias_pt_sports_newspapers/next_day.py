@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from cover_metrics import unpack_label_masks
+from utils import Clubs, Newspaper
+
+# Outcomes of a game for a team. non-win is a draw or a loss.
+OUTCOMES = ('win', 'non-win', 'draw', 'loss')
+ANALYSIS_CLUBS = (Clubs.BENFICA, Clubs.PORTO, Clubs.SPORTING)
+
+
+def club_team_name(club):
+    """The name of the club in games_data.csv"""
+    return club.name.capitalize()
+
+
+def _day_index(dates, start):
+    dates = pd.to_datetime(pd.Series(dates)).values.astype('datetime64[D]')
+    return (dates - start).astype(np.int64)
+
+
+def outcome_tensor(games_df, teams, start, n_days):
+    """
+    Counts (OUTCOMES x teams x days) of the games of each team, by outcome,
+    on each day since start.
+    """
+    home_score = pd.to_numeric(games_df['Home_Score']).values
+    away_score = pd.to_numeric(games_df['Away_Score']).values
+    days = _day_index(games_df['Date'], start)
+    res = np.zeros((len(OUTCOMES), len(teams), n_days), dtype=np.int64)
+
+    for team_idx, team in enumerate(teams):
+        for team_col, diff in (('Home_Team', home_score - away_score),
+                               ('Away_Team', away_score - home_score)):
+            plays = (games_df[team_col] == team).values
+            team_days, team_diff = days[plays], diff[plays]
+            for outcome, has_outcome in (('win', team_diff > 0),
+                                         ('draw', team_diff == 0),
+                                         ('loss', team_diff < 0)):
+                np.add.at(res[OUTCOMES.index(outcome), team_idx],
+                          team_days[has_outcome], 1)
+
+    res[OUTCOMES.index('non-win')] = (res[OUTCOMES.index('draw')] +
+                                      res[OUTCOMES.index('loss')])
+    return res
+
+
+def highlight_tensor(covers_df, newspapers, clubs, start, n_days):
+    """
+    Boolean (newspapers x clubs x days) tensor, true when the cover of the
+    newspaper highlighted the club on each day since start.
+    """
+    newspaper_idx = pd.Index(newspapers).get_indexer(covers_df['Newspaper'])
+    known = newspaper_idx >= 0
+    days = _day_index(covers_df['Date'], start)[known]
+    highlighted = unpack_label_masks(
+        covers_df['Highlighted_Mask'].values[known])[:, [c.id for c in clubs]]
+
+    res = np.zeros((len(newspapers), len(clubs), n_days), dtype=bool)
+    res[newspaper_idx[known], :, days] = highlighted
+    return res
+
+
+def next_day_tensors(covers_df, games_df, newspapers, clubs, max_lag):
+    """
+    The outcome_tensor of the clubs and the highlight_tensor of the
+    newspapers, over the days of the covers and games plus max_lag more
+    days, so that every game can be shifted to its cover.
+    """
+    all_dates = pd.concat([covers_df['Date'], games_df['Date']])
+    start = np.datetime64(all_dates.min(), 'D')
+    n_days = int((np.datetime64(all_dates.max(), 'D') - start) /
+                 np.timedelta64(1, 'D')) + 1 + max_lag
+
+    games = outcome_tensor(games_df, [club_team_name(c) for c in clubs],
+                           start, n_days)
+    covers = highlight_tensor(covers_df, newspapers, clubs, start, n_days)
+    return games, covers
+
+
+def shift_days(covers, lag):
+    """covers[..., d + lag] aligned with the games of day d"""
+    shifted = np.zeros_like(covers)
+    shifted[..., :covers.shape[-1] - lag] = covers[..., lag:]
+    return shifted
+
+
+def next_day_table(covers_df,
+                   games_df,
+                   newspapers=None,
+                   clubs=ANALYSIS_CLUBS,
+                   lags=(1, ),
+                   outcomes=('win', 'non-win')):
+    """
+    For every newspaper, club, outcome and lag, counts the games of the club
+    with that outcome (events) and how many of them were followed, lag days
+    later, by a cover of the newspaper highlighting the club.
+
+    The outcome and highlight tensors are built once and every combination
+    is computed from them with array operations. Returns a tidy DataFrame
+    with the columns Newspaper, Club, Outcome, Lag, Events, Highlighted and
+    Rate.
+    """
+    if newspapers is None:
+        newspapers = [n.lower() for n in Newspaper.names()]
+
+    games, covers = next_day_tensors(covers_df, games_df, newspapers, clubs,
+                                     max(lags))
+    games = games[[OUTCOMES.index(o) for o in outcomes]]
+
+    events = games.sum(axis=2)  # outcomes x clubs
+    tables = []
+    for lag in lags:
+        highlighted = np.einsum('ocd,ncd->noc', games,
+                                shift_days(covers, lag))
+
+        n_idx, o_idx, c_idx = np.indices(highlighted.shape).reshape(3, -1)
+        tables.append(
+            pd.DataFrame({
+                'Newspaper': np.asarray(newspapers)[n_idx],
+                'Club': np.asarray([c.name.lower() for c in clubs])[c_idx],
+                'Outcome': np.asarray(outcomes)[o_idx],
+                'Lag': lag,
+                'Events': events[o_idx, c_idx],
+                'Highlighted': highlighted.reshape(-1),
+            }))
+
+    table = pd.concat(tables, ignore_index=True)
+    table['Rate'] = table['Highlighted'] / table['Events']
+    return table
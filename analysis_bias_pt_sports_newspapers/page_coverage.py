@@ -0,0 +1,189 @@
+"""
+Area of each cover taken by each label, counting overlapping boxes once.
+
+cover_metrics.label_areas sums the areas of the boxes, so a club with two
+overlapping boxes, or an ad drawn over a headline, is counted twice. Here
+the boxes are rasterized on a grid of cells over the page and each label
+gets the area of the union of its boxes, as a share of the page.
+
+Every cover of the flat box arrays (see annotation_store.ARRAYS) is
+rasterized in the same batched pass, a chunk of covers at a time: the
+corners of the boxes are added to one difference image per (cover, label)
+and their 2d cumulative sum counts the boxes over each cell. The share is
+exact up to half a cell along each box edge; union_area computes the exact
+area of a few boxes.
+"""
+import numpy as np
+import pandas as pd
+from covers_dataset import get_file_path_date, get_file_path_newspaper
+from utils import LabelClass
+
+# Cells along the width and height of every page
+GRID = (96, 120)
+CHUNK_COVERS = 128
+
+
+def union_area(boxes):
+    """
+    Exact area of the union of (n, 4) xmin, ymin, xmax, ymax boxes, over
+    the grid of their distinct coordinates.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0:
+        return 0.
+    xs = np.unique(boxes[:, [0, 2]])
+    ys = np.unique(boxes[:, [1, 3]])
+    cx, cy = (xs[:-1] + xs[1:]) / 2, (ys[:-1] + ys[1:]) / 2
+    inside_x = (boxes[:, 0, None] <= cx) & (cx < boxes[:, 2, None])
+    inside_y = (boxes[:, 1, None] <= cy) & (cy < boxes[:, 3, None])
+    covered = (inside_x[:, :, None] & inside_y[:, None, :]).any(axis=0)
+    return float((np.diff(xs)[:, None] * np.diff(ys)[None, :] *
+                  covered).sum())
+
+
+def _rasterize(cover_ids, labels, boxes, sizes, n_covers, grid):
+    """
+    (n_covers, LabelClass, height, width) cells covered by the boxes of
+    each label of each cover
+    """
+    width, height = grid
+    n_labels = len(LabelClass)
+    sizes = np.asarray(sizes, dtype=np.float64)[cover_ids]
+    x = np.asarray(boxes[:, [0, 2]], dtype=np.float64) * width / sizes[:, :1]
+    y = np.asarray(boxes[:, [1, 3]], dtype=np.float64) * height / sizes[:, 1:]
+    x = np.clip(np.rint(x), 0, width).astype(np.int64)
+    y = np.clip(np.rint(y), 0, height).astype(np.int64)
+
+    groups = cover_ids * n_labels + np.asarray(labels)
+    counts = np.zeros((n_covers * n_labels, height + 1, width + 1),
+                      dtype=np.int16)
+    np.add.at(counts, (groups, y[:, 0], x[:, 0]), 1)
+    np.add.at(counts, (groups, y[:, 0], x[:, 1]), -1)
+    np.add.at(counts, (groups, y[:, 1], x[:, 0]), -1)
+    np.add.at(counts, (groups, y[:, 1], x[:, 1]), 1)
+    np.cumsum(counts, axis=1, out=counts)
+    np.cumsum(counts, axis=2, out=counts)
+    covered = counts[:, :height, :width] > 0
+    return covered.reshape(n_covers, n_labels, height, width)
+
+
+def coverage_metrics(arrays,
+                     grid=GRID,
+                     chunk_covers=CHUNK_COVERS,
+                     occluders=(LabelClass.PUB, )):
+    """
+    Computes, for every cover of the flat box arrays:
+    - share: covers x LabelClass share of the page in the union of the
+      boxes of each label
+    - visible: the same, without the cells also covered by the boxes of
+      the occluders (e.g. ads over a headline)
+    - page: share of the page covered by any box
+    - area: share in pixels of the cover
+    """
+    offsets = np.asarray(arrays['offsets'])
+    sizes = np.asarray(arrays['sizes'])
+    n_covers, n_labels = len(offsets) - 1, len(LabelClass)
+    n_cells = grid[0] * grid[1]
+    occluder_ids = [label.id for label in occluders]
+
+    share = np.zeros((n_covers, n_labels))
+    visible = np.zeros((n_covers, n_labels))
+    page = np.zeros(n_covers)
+    for first in range(0, n_covers, chunk_covers):
+        last = min(first + chunk_covers, n_covers)
+        start, end = offsets[first], offsets[last]
+        covered = _rasterize(
+            np.asarray(arrays['cover_ids'][start:end], dtype=np.int64) -
+            first, arrays['labels'][start:end], arrays['boxes'][start:end],
+            sizes[first:last], last - first, grid)
+
+        share[first:last] = covered.sum(axis=(2, 3)) / n_cells
+        occluded = covered[:, occluder_ids].any(axis=1, keepdims=True)
+        uncovered = covered & ~occluded
+        uncovered[:, occluder_ids] = covered[:, occluder_ids]
+        visible[first:last] = uncovered.sum(axis=(2, 3)) / n_cells
+        page[first:last] = covered.any(axis=1).sum(axis=(1, 2)) / n_cells
+
+    metrics = {}
+    metrics['share'] = share
+    metrics['visible'] = visible
+    metrics['page'] = page
+    metrics['area'] = share * (sizes[:, 0] * sizes[:, 1]).astype(
+        np.float64)[:, None]
+    return metrics
+
+
+def coverage_frame(names, arrays, grid=GRID, chunk_covers=CHUNK_COVERS):
+    """
+    Date, Newspaper and the share of the page of each label (lower case
+    columns) and of any box (page) of the covers with the given names
+    (<newspaper>_<date>). Covers without boxes are skipped, like in
+    analysis.covers_frame.
+    """
+    metrics = coverage_metrics(arrays, grid, chunk_covers)
+    keep = np.flatnonzero(np.diff(np.asarray(arrays['offsets'])) > 0)
+    df = pd.DataFrame({
+        'Date':
+        pd.to_datetime([get_file_path_date(names[i]) for i in keep],
+                       format='%Y-%m-%d'),
+        'Newspaper': [get_file_path_newspaper(names[i]).lower() for i in keep],
+    })
+    for label in LabelClass:
+        if label != LabelClass.BACKGROUND:
+            df[label.name.lower()] = metrics['share'][keep, label.id]
+    df['page'] = metrics['page'][keep]
+    return df
+
+
+class CoverageSums(object):
+    """
+    Sums of the columns of a coverage_frame over any date range, from
+    their cumulative sums per newspaper.
+    """
+    def __init__(self, coverage_df, columns=None):
+        if columns is None:
+            columns = [c for c in coverage_df.columns
+                       if c not in ('Date', 'Newspaper')]
+        self.columns = list(columns)
+        self._days = {}
+        self._cumsums = {}
+        for newspaper, df in coverage_df.groupby('Newspaper'):
+            df = df.sort_values('Date')
+            self._days[newspaper] = df['Date'].values.astype('datetime64[D]')
+            cumsum = np.zeros((len(df) + 1, len(self.columns)))
+            np.cumsum(df[self.columns].values, axis=0, out=cumsum[1:])
+            self._cumsums[newspaper] = cumsum
+
+    @property
+    def newspapers(self):
+        return sorted(self._days)
+
+    def _bounds(self, newspaper, start, end):
+        days = self._days[newspaper]
+        first = 0 if start is None else np.searchsorted(
+            days, np.datetime64(pd.Timestamp(start).date(), 'D'))
+        last = len(days) if end is None else np.searchsorted(
+            days, np.datetime64(pd.Timestamp(end).date(), 'D'), side='right')
+        return first, last
+
+    def sums(self, start=None, end=None, newspapers=None):
+        """
+        DataFrame of the sums (newspapers x columns) of the covers from
+        start to end inclusive (default unbounded), with their count in
+        covers.
+        """
+        if newspapers is None:
+            newspapers = self.newspapers
+        rows = []
+        for newspaper in newspapers:
+            first, last = self._bounds(newspaper, start, end)
+            cumsum = self._cumsums[newspaper]
+            rows.append(np.append(cumsum[last] - cumsum[first], last - first))
+        return pd.DataFrame(rows,
+                            index=pd.Index(newspapers, name='Newspaper'),
+                            columns=self.columns + ['covers'])
+
+    def means(self, start=None, end=None, newspapers=None):
+        """Mean share of the page of each column, per cover"""
+        sums = self.sums(start, end, newspapers)
+        return sums[self.columns].div(sums['covers'], axis=0)
@@ -0,0 +1,146 @@
+"""
+Per-stage instrumentation of the pipeline.
+
+    profiler = Profiler()
+    with profiler.stage('load covers') as info:
+        covers_df = update_covers_df(info=info)
+        info['rows'] = len(covers_df)
+    print(profiler.summary())
+
+Each stage records its wall and cpu time, the peak RSS of the process so
+far at its end (a high-water mark over all the stages before it, not a
+peak of the stage), and whatever counts the stage adds to its info dict
+(rows, boxes, cache hit/miss, ...). With trace_memory, each stage also
+records the peak of the memory allocated while it ran, with tracemalloc,
+which slows down allocations. A disabled profiler only runs the stages.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+
+def _max_rss_bytes():
+    """Peak RSS of the process so far, None where unavailable (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class Profiler(object):
+    """
+    Records the stages run through stage(). With cprofile_dir, each stage
+    is also run under cProfile and its stats dumped to
+    <cprofile_dir>/<stage>.prof. With trace_memory, the peak allocations of
+    each stage are recorded (of the outermost one, for nested stages).
+    """
+    def __init__(self, enabled=True, cprofile_dir=None, trace_memory=False):
+        self.enabled = enabled
+        self.cprofile_dir = cprofile_dir
+        self.trace_memory = trace_memory
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, name, **counts):
+        info = dict(counts)
+        if not self.enabled:
+            yield info
+            return
+
+        profile = None
+        if self.cprofile_dir is not None:
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            profile = cProfile.Profile()
+            profile.enable()
+
+        trace = self.trace_memory and not tracemalloc.is_tracing()
+        if trace:
+            tracemalloc.start()
+
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield info
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            peak_alloc = None
+            if trace:
+                _, peak_alloc = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            if profile is not None:
+                profile.disable()
+                filename = name.replace(' ', '_').replace('/', '_') + '.prof'
+                profile.dump_stats(os.path.join(self.cprofile_dir, filename))
+
+            record = {
+                'stage': name,
+                'wall_s': wall,
+                'cpu_s': cpu,
+                'max_rss_bytes': _max_rss_bytes(),
+            }
+            if trace:
+                record['peak_alloc_bytes'] = peak_alloc
+            record.update(info)
+            self.records.append(record)
+
+    def profile(self, name=None):
+        """Decorator running the whole function as a stage"""
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                with self.stage(name or fn.__name__):
+                    return fn(*args, **kwargs)
+
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            return wrapper
+
+        return decorator
+
+    def summary(self):
+        """The records as a text table"""
+        memory_keys = ('max_rss_bytes', 'peak_alloc_bytes')
+        extra_keys = []
+        for record in self.records:
+            for key in record:
+                if key not in ('stage', 'wall_s', 'cpu_s') + memory_keys \
+                        and key not in extra_keys:
+                    extra_keys.append(key)
+        traced = any('peak_alloc_bytes' in r for r in self.records)
+
+        def mb(value):
+            return '' if value is None else f'{value / 2**20:.1f}'
+
+        header = ['stage', 'wall (s)', 'cpu (s)', 'process max rss (MB)']
+        if traced:
+            header.append('stage peak alloc (MB)')
+        header += extra_keys
+        rows = [header]
+        for r in self.records:
+            row = [
+                r['stage'], f"{r['wall_s']:.3f}", f"{r['cpu_s']:.3f}",
+                mb(r['max_rss_bytes'])
+            ]
+            if traced:
+                row.append(mb(r.get('peak_alloc_bytes')))
+            rows.append(row + [str(r.get(key, '')) for key in extra_keys])
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = ['  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip()
+                 for row in rows]
+        lines.insert(1, '  '.join('-' * w for w in widths))
+        return '\n'.join(lines)
+
+    def to_json(self, path=None):
+        """The records as a JSON trace, also written to path if given"""
+        trace = json.dumps({'stages': self.records}, indent=2, default=str)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(trace)
+        return trace
@@ -0,0 +1,145 @@
+"""
+Renders many figures in parallel, on the headless Agg backend.
+
+Each figure is described by a FigureSpec:
+- newspaper: newspaper name, or None for all of them in one figure
+- year: year of the covers to plot, or None for every year
+- view: one of VIEWS
+- output_path: where the figure is saved
+"""
+import os
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+
+FigureSpec = namedtuple('FigureSpec',
+                        ['newspaper', 'year', 'view', 'output_path'])
+
+VIEWS = ('calendar', 'month')
+
+# Set in each worker by _init_worker
+_covers_df = None
+_cube = None
+
+
+def _plot_fns():
+    from analysis import year_calendar_plot, month_plot
+    return {
+        'calendar': year_calendar_plot,
+        'month': month_plot,
+    }
+
+
+def _styles():
+    from analysis import CALENDAR_STYLE, MONTH_STYLE
+    return {
+        'calendar': CALENDAR_STYLE,
+        'month': MONTH_STYLE,
+    }
+
+
+def _init_worker(covers_df, cube=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    from cover_cube import CoverCube
+
+    global _covers_df, _cube
+    _covers_df = covers_df
+    _cube = cube if cube is not None else CoverCube.from_covers_df(covers_df)
+
+
+def render_figure(spec, covers_df=None, cube=None):
+    import matplotlib.pyplot as plt
+
+    if covers_df is None:
+        covers_df, cube = _covers_df, _cube
+
+    plot_fn = _plot_fns()[spec.view]
+    newspapers = None if spec.newspaper is None else [spec.newspaper]
+    years = None if spec.year is None else [spec.year]
+    fig = plot_fn(covers_df,
+                  newspapers=newspapers,
+                  years=years,
+                  out_path=spec.output_path,
+                  cube=cube)
+    plt.close(fig)
+    return spec.output_path
+
+
+def _render_timed(spec):
+    """Renders spec, returns its wall time in seconds"""
+    start = time.perf_counter()
+    render_figure(spec)
+    return time.perf_counter() - start
+
+
+def render_figures(specs,
+                   covers_df,
+                   workers=None,
+                   cache=None,
+                   cube=None,
+                   timings=None):
+    """
+    Renders every spec, in a process pool of the given number of workers
+    (None uses every cpu, 1 renders in this process). Each worker gets the
+    covers frame, and its CoverCube (built once if not given), once.
+    Returns the output paths of the rendered figures.
+
+    With a RenderCache (see render_cache.py), figures whose data and style
+    did not change are copied from the cache instead of being rendered.
+    If given, the timings dict is filled with the wall time in seconds of
+    each rendered figure (by output path), measured where it was rendered.
+    """
+    for spec in specs:
+        if spec.view not in VIEWS:
+            raise ValueError(f'Unknown view {spec.view}')
+
+    keys = {}
+    if cache is not None:
+        from render_cache import figure_key
+        styles = _styles()
+        for spec in specs:
+            keys[spec] = figure_key(spec, covers_df, styles[spec.view])
+        specs = [s for s in specs if not cache.get(keys[s], s.output_path)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(specs))
+    if workers <= 1:
+        _init_worker(covers_df, cube)
+        seconds = [_render_timed(spec) for spec in specs]
+    else:
+        with Pool(workers, initializer=_init_worker,
+                  initargs=(covers_df, cube)) as pool:
+            seconds = pool.map(_render_timed, specs, chunksize=1)
+    if timings is not None:
+        for spec, spec_seconds in zip(specs, seconds):
+            timings[spec.output_path] = spec_seconds
+
+    if cache is not None:
+        for spec in specs:
+            cache.put(keys[spec], spec.output_path)
+
+    return [spec.output_path for spec in specs]
+
+
+def report_specs(covers_df, out_dir='.'):
+    """
+    Specs of a full report: every view for every newspaper and year, plus
+    every view with all newspapers and years together.
+    """
+    from utils import Newspaper
+
+    specs = [
+        FigureSpec(None, None, view, os.path.join(out_dir, f'{view}_view.png'))
+        for view in VIEWS
+    ]
+    for year in sorted(covers_df['Date'].dt.year.unique()):
+        for newspaper in Newspaper.names():
+            for view in VIEWS:
+                specs.append(
+                    FigureSpec(
+                        newspaper, int(year), view,
+                        os.path.join(out_dir,
+                                     f'{view}_{newspaper.lower()}_{year}.png')))
+    return specs
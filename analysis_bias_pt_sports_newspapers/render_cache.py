@@ -0,0 +1,94 @@
+"""
+Content addressed cache of the rendered figures.
+
+A figure is keyed by a hash of the data it plots and of the plotting
+parameters of its view, so it is only rendered again when one of them
+changes. The cache is a directory of <key>.png files, bounded in size by
+evicting the least recently used ones.
+"""
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# Bump when the plotting code changes in a way that alters the figures
+RENDER_CACHE_VERSION = 1
+
+
+def figure_key(spec, covers_df, style):
+    """
+    Hash of the covers plotted by spec (see render.FigureSpec) and of the
+    style of its view. The output path is not part of the key.
+    """
+    df = covers_df
+    if spec.newspaper is not None:
+        df = df[df['Newspaper'] == spec.newspaper.lower()]
+    if spec.year is not None:
+        df = df[df['Date'].dt.year == spec.year]
+    df = df.sort_values(['Newspaper', 'Date'])
+
+    h = hashlib.sha256()
+    h.update(
+        json.dumps([
+            RENDER_CACHE_VERSION, spec.view, spec.newspaper, spec.year, style
+        ],
+                   sort_keys=True,
+                   default=str).encode())
+    h.update(df['Date'].values.astype('datetime64[D]').tobytes())
+    h.update('\0'.join(df['Newspaper']).encode())
+    h.update(np.ascontiguousarray(df['Highlighted_Mask'].values).tobytes())
+    return h.hexdigest()
+
+
+class RenderCache(object):
+    """
+    Directory of rendered figures, keyed by figure_key, holding at most
+    max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=128 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.png')
+
+    def get(self, key, out_path):
+        """
+        Copies the cached figure to out_path. Returns False on a miss.
+        """
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, out_path)
+        except FileNotFoundError:
+            return False
+        # Mark as recently used
+        os.utime(path)
+        return True
+
+    def put(self, key, figure_path):
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        shutil.copyfile(figure_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used figures until the cache fits in
+        max_bytes.
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.png'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
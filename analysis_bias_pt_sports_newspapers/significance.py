@@ -0,0 +1,200 @@
+"""
+Significance of the highlight rates of the next day analysis and of the
+monthly means.
+
+For every newspaper and club, each game of the club is a sample: its
+outcome (win or non-win) and whether the cover of the next day
+highlighted the club. The permutation test shuffles the outcomes between
+the games to get the p-value of the difference between the highlight
+rates after wins and after non-wins. Bootstrap resamples of the games of
+each outcome give confidence intervals of the rates and their difference.
+
+The resamples are drawn as index arrays, many at once, in chunks of at
+most chunk_elements indices to bound memory.
+"""
+import numpy as np
+import pandas as pd
+from next_day import OUTCOMES, ANALYSIS_CLUBS, next_day_tensors, shift_days
+from utils import Newspaper, pool_map
+
+CHUNK_ELEMENTS = 2**22
+
+
+def _chunks(n_resamples, n_samples, chunk_elements):
+    """Sizes of the chunks of resamples of n_samples indices each"""
+    per_chunk = max(1, chunk_elements // max(n_samples, 1))
+    sizes = [per_chunk] * (n_resamples // per_chunk)
+    if n_resamples % per_chunk:
+        sizes.append(n_resamples % per_chunk)
+    return sizes
+
+
+def bootstrap_means(values, n_resamples, rng, chunk_elements=CHUNK_ELEMENTS):
+    """(n_resamples,) means of bootstrap resamples of values"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.full(n_resamples, np.nan)
+    means = []
+    for size in _chunks(n_resamples, len(values), chunk_elements):
+        idx = rng.integers(0, len(values), (size, len(values)))
+        means.append(values[idx].mean(axis=1))
+    return np.concatenate(means)
+
+
+def permutation_diffs(values, groups, n_resamples, rng,
+                      chunk_elements=CHUNK_ELEMENTS):
+    """
+    (n_resamples,) differences between the means of values in group True
+    and in group False, with the groups randomly permuted.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n, n_true = len(values), int(np.sum(groups))
+    if n_true == 0 or n_true == n:
+        return np.full(n_resamples, np.nan)
+    diffs = []
+    for size in _chunks(n_resamples, n, chunk_elements):
+        # Row-wise random permutations: argsort of random keys
+        perm = rng.random((size, n)).argsort(axis=1)
+        sums_true = values[perm[:, :n_true]].sum(axis=1)
+        sums_false = values.sum() - sums_true
+        diffs.append(sums_true / n_true - sums_false / (n - n_true))
+    return np.concatenate(diffs)
+
+
+def game_samples(covers_df, games_df, newspapers, clubs=ANALYSIS_CLUBS,
+                 lag=1):
+    """
+    {(newspaper, club): (is_win, highlighted)} boolean arrays with one
+    entry per game of the club, in the order of the days.
+    """
+    games, covers = next_day_tensors(covers_df, games_df, newspapers, clubs,
+                                     lag)
+    shifted = shift_days(covers, lag)
+    n_days = shifted.shape[-1]
+
+    win, non_win = OUTCOMES.index('win'), OUTCOMES.index('non-win')
+    samples = {}
+    for c, club in enumerate(clubs):
+        # A day with many games of the club is one sample per game
+        days = np.concatenate([
+            np.repeat(np.arange(n_days), games[win, c]),
+            np.repeat(np.arange(n_days), games[non_win, c])
+        ])
+        is_win = np.arange(len(days)) < games[win, c].sum()
+        order = np.argsort(days, kind='stable')
+        days, is_win = days[order], is_win[order]
+        for n, newspaper in enumerate(newspapers):
+            samples[(newspaper, club.name.lower())] = (is_win,
+                                                       shifted[n, c, days])
+    return samples
+
+
+def _percentiles(values, alpha):
+    if np.all(np.isnan(values)):
+        return np.nan, np.nan
+    return tuple(np.nanpercentile(values, [100 * alpha / 2,
+                                           100 * (1 - alpha / 2)]))
+
+
+def _combination_significance(args):
+    (key, is_win, highlighted, n_permutations, n_bootstrap, alpha, seed,
+     chunk_elements) = args
+    rng = np.random.default_rng(seed)
+    highlighted = highlighted.astype(np.float64)
+    wins, non_wins = highlighted[is_win], highlighted[~is_win]
+
+    win_rates = bootstrap_means(wins, n_bootstrap, rng, chunk_elements)
+    non_win_rates = bootstrap_means(non_wins, n_bootstrap, rng,
+                                    chunk_elements)
+    diff = (wins.mean() - non_wins.mean()
+            if len(wins) and len(non_wins) else np.nan)
+    perm_diffs = permutation_diffs(highlighted, is_win, n_permutations, rng,
+                                   chunk_elements)
+    # Two sided, counting the observed difference as one of the resamples
+    p_value = ((1 + np.sum(np.abs(perm_diffs) >= abs(diff) - 1e-12)) /
+               (1 + n_permutations) if not np.isnan(diff) else np.nan)
+
+    row = {'Newspaper': key[0], 'Club': key[1]}
+    row['Wins'] = len(wins)
+    row['Win_Rate'] = wins.mean() if len(wins) else np.nan
+    row['Win_CI_Low'], row['Win_CI_High'] = _percentiles(win_rates, alpha)
+    row['Non_Wins'] = len(non_wins)
+    row['Non_Win_Rate'] = non_wins.mean() if len(non_wins) else np.nan
+    row['Non_Win_CI_Low'], row['Non_Win_CI_High'] = _percentiles(
+        non_win_rates, alpha)
+    row['Diff'] = diff
+    row['Diff_CI_Low'], row['Diff_CI_High'] = _percentiles(
+        win_rates - non_win_rates, alpha)
+    row['P_Value'] = p_value
+    return row
+
+
+def next_day_significance(covers_df,
+                          games_df,
+                          newspapers=None,
+                          clubs=ANALYSIS_CLUBS,
+                          lag=1,
+                          n_permutations=10000,
+                          n_bootstrap=10000,
+                          alpha=.05,
+                          seed=0,
+                          workers=1,
+                          chunk_elements=CHUNK_ELEMENTS):
+    """
+    For every newspaper and club, the highlight rates after wins and after
+    non-wins with their (1 - alpha) bootstrap confidence intervals, the
+    difference between them with its interval, and the permutation test
+    p-value of the difference. The combinations are computed in a process
+    pool of the given number of workers (None uses every cpu). The results
+    only depend on the seed, not on the number of workers.
+    """
+    if newspapers is None:
+        newspapers = [n.lower() for n in Newspaper.names()]
+
+    samples = game_samples(covers_df, games_df, newspapers, clubs, lag)
+    jobs = [(key, is_win, highlighted, n_permutations, n_bootstrap, alpha,
+             [seed, i], chunk_elements)
+            for i, (key, (is_win, highlighted)) in enumerate(samples.items())]
+    return pd.DataFrame(pool_map(_combination_significance, jobs, workers))
+
+
+def monthly_confidence(cube,
+                       newspapers=None,
+                       years=None,
+                       n_bootstrap=10000,
+                       alpha=.05,
+                       seed=0,
+                       chunk_elements=CHUNK_ELEMENTS):
+    """
+    The monthly means of month_plot (share of the covers of each month of
+    the year highlighting each club) with their (1 - alpha) bootstrap
+    confidence intervals, from a CoverCube (see cover_cube.py).
+    """
+    from cover_cube import CHANNELS, COVERS
+
+    if newspapers is None:
+        newspapers = cube.newspapers
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for newspaper in newspapers:
+        counts = cube.month_of_year_counts(newspaper, years)
+        for month in np.flatnonzero(counts[:, COVERS]):
+            n_covers = counts[month, COVERS]
+            for channel in range(COVERS):
+                k = counts[month, channel]
+                # The covers of the month, 1 when highlighting the club
+                values = np.arange(n_covers) < k
+                means = bootstrap_means(values, n_bootstrap, rng,
+                                        chunk_elements)
+                low, high = _percentiles(means, alpha)
+                rows.append({
+                    'Newspaper': newspaper.lower(),
+                    'Month': month + 1,
+                    'Club': CHANNELS[channel],
+                    'Covers': n_covers,
+                    'Mean': k / n_covers,
+                    'CI_Low': low,
+                    'CI_High': high,
+                })
+    return pd.DataFrame(rows)
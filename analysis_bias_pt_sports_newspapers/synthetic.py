@@ -0,0 +1,141 @@
+"""
+Generates a synthetic dataset with the layout of ./data/, to measure how the
+pipeline scales beyond the bundled labels:
+
+    <out>/labels/<Newspaper>_<date>.xml   Pascal VOC labels
+    <out>/covers/<Newspaper>_<date>.jpeg  optional, small covers
+    <out>/games_data.csv                  games of the clubs
+
+Run from the main folder, e.g.
+
+    python synthetic.py /tmp/synthetic --newspapers 6 --years 10
+"""
+import csv
+import datetime
+import os
+import numpy as np
+from utils import LabelClass, Newspaper
+
+COVER_WIDTH, COVER_HEIGHT = 1050, 1305
+CLUB_TEAMS = ['Benfica', 'Porto', 'Sporting']
+OTHER_TEAMS = [f'Team {i}' for i in range(15)]
+
+
+def newspaper_names(n):
+    names = Newspaper.names()[:n]
+    return names + [f'Synthetic{i}' for i in range(len(names), n)]
+
+
+def _label_xml(filename, labels, boxes):
+    objects = ''.join(
+        f'<object><name>{LabelClass(label).name}</name><pose>Unspecified</pose>'
+        f'<truncated>0</truncated><difficult>0</difficult><bndbox>'
+        f'<xmin>{x0}</xmin><ymin>{y0}</ymin><xmax>{x1}</xmax><ymax>{y1}</ymax>'
+        f'</bndbox></object>' for label, (x0, y0, x1, y1) in zip(labels, boxes))
+    return (f'<annotation><folder>covers</folder><filename>{filename}'
+            f'</filename><size><width>{COVER_WIDTH}</width><height>'
+            f'{COVER_HEIGHT}</height><depth>3</depth></size><segmented>0'
+            f'</segmented>{objects}</annotation>')
+
+
+def _random_boxes(rng, n):
+    x0 = rng.integers(0, COVER_WIDTH - 50, n)
+    y0 = rng.integers(0, COVER_HEIGHT - 50, n)
+    x1 = x0 + rng.integers(20, COVER_WIDTH - x0)
+    y1 = y0 + rng.integers(20, COVER_HEIGHT - y0)
+    return np.stack([x0, y0, x1, y1], axis=1)
+
+
+def generate_dataset(out_dir,
+                     newspapers=3,
+                     years=1,
+                     start_year=2019,
+                     boxes_per_cover=7,
+                     holiday_rate=.01,
+                     images=False,
+                     image_size=(105, 131),
+                     seed=0):
+    """
+    Writes the labels (and optionally covers) of `newspapers` newspapers
+    over `years` years, with on average boxes_per_cover boxes per cover,
+    plus a matching games_data.csv. Returns the number of label files.
+    """
+    rng = np.random.default_rng(seed)
+    labels_dir = os.path.join(out_dir, 'labels')
+    os.makedirs(labels_dir, exist_ok=True)
+    if images:
+        from PIL import Image
+        covers_dir = os.path.join(out_dir, 'covers')
+        os.makedirs(covers_dir, exist_ok=True)
+
+    start = datetime.date(start_year, 1, 1)
+    end = datetime.date(start_year + years, 1, 1)
+    days = [
+        start + datetime.timedelta(days=i) for i in range((end - start).days)
+    ]
+    label_ids = [c.id for c in LabelClass if c != LabelClass.BACKGROUND]
+
+    n_files = 0
+    for name in newspaper_names(newspapers):
+        for day in days:
+            filename = f'{name}_{day}'
+            if rng.random() < holiday_rate:
+                n_boxes = 0
+            else:
+                n_boxes = max(1, rng.poisson(boxes_per_cover))
+            labels = rng.choice(label_ids, n_boxes)
+            boxes = _random_boxes(rng, n_boxes)
+            with open(os.path.join(labels_dir, filename + '.xml'), 'w') as f:
+                f.write(_label_xml(filename + '.jpeg', labels, boxes))
+            if images:
+                color = tuple(int(c) for c in rng.integers(0, 256, 3))
+                Image.new('RGB', image_size, color).save(
+                    os.path.join(covers_dir, filename + '.jpeg'))
+            n_files += 1
+
+    # Every club plays about twice a week
+    with open(os.path.join(out_dir, 'games_data.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ['away_score', 'away_team', 'date', 'home_score', 'home_team'])
+        for day in days:
+            for club in CLUB_TEAMS:
+                if rng.random() > 2 / 7:
+                    continue
+                other = OTHER_TEAMS[rng.integers(len(OTHER_TEAMS))]
+                home, away = (club, other) if rng.random() < .5 else (other,
+                                                                      club)
+                writer.writerow([
+                    rng.poisson(1.2), away,
+                    day.isoformat(),
+                    rng.poisson(1.5), home
+                ])
+
+    return n_files
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('out', type=str)
+    parser.add_argument('--newspapers', type=int, default=3)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--start-year', type=int, default=2019)
+    parser.add_argument('--boxes', type=float, default=7)
+    parser.add_argument('--images', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    n_files = generate_dataset(args.out,
+                               newspapers=args.newspapers,
+                               years=args.years,
+                               start_year=args.start_year,
+                               boxes_per_cover=args.boxes,
+                               images=args.images,
+                               seed=args.seed)
+    print(f'Generated {n_files} label files in {args.out}')
+
+
+if __name__ == '__main__':
+    main()
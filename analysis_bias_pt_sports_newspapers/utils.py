@@ -48,3 +48,61 @@ class LabelClass(Enum):
     @staticmethod
     def names():
         return [c.name for c in LabelClass]
+
+
+def files_fingerprint(paths):
+    """
+    Hash of the name, size and modification time of the given files. It
+    changes whenever one of them is added, removed or modified.
+    """
+    import hashlib
+    import os
+
+    h = hashlib.sha1()
+    for path in sorted(paths):
+        st = os.stat(path)
+        h.update(f'{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns};'.encode())
+    return h.hexdigest()
+
+
+def to_day(date):
+    """date (str, date, datetime, Timestamp or datetime64) as datetime64[D]"""
+    import numpy as np
+    import pandas as pd
+
+    return np.datetime64(pd.Timestamp(date).date(), 'D')
+
+
+def start_pool(workers, n_jobs=None):
+    """
+    Process pool of workers processes (None uses every cpu), at most one per
+    job. None when a single process is enough or a pool can not be
+    started, for the callers to run the jobs serially.
+    """
+    import os
+    from multiprocessing import Pool
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if n_jobs is not None:
+        workers = min(workers, n_jobs)
+    if workers <= 1:
+        return None
+    # Only the pool start is guarded: the jobs may raise OSErrors too
+    try:
+        return Pool(workers)
+    except OSError:
+        return None
+
+
+def pool_map(fn, jobs, workers=1, chunksize=1):
+    """
+    [fn(job) for job in jobs], in a process pool when workers > 1 (see
+    start_pool), serially otherwise.
+    """
+    jobs = list(jobs)
+    pool = start_pool(workers, len(jobs))
+    if pool is None:
+        return [fn(job) for job in jobs]
+    with pool:
+        return pool.map(fn, jobs, chunksize)
@@ -0,0 +1,21 @@
+import os
+import shutil
+import sys
+import pytest
+
+PACKAGE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'analysis_bias_pt_sports_newspapers')
+DATA_DIR = os.path.join(PACKAGE_DIR, 'data')
+
+# The modules of the analysis import each other as top level modules
+sys.path.insert(0, PACKAGE_DIR)
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    """A copy of the bundled labels and games, free to modify"""
+    root = tmp_path / 'data'
+    shutil.copytree(os.path.join(DATA_DIR, 'labels'), root / 'labels')
+    shutil.copy(os.path.join(DATA_DIR, 'games_data.csv'), root)
+    return str(root)
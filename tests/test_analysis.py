@@ -0,0 +1,95 @@
+import datetime as dt
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from analysis import (cover_data_to_pandas, games_data_to_pandas,
+                      update_covers_df)
+from cover_cube import CHANNELS, CoverCube
+from conftest import DATA_DIR
+
+
+def _assert_same_covers(covers_df, root):
+    full_df = cover_data_to_pandas(root, use_store=False)
+    pd.testing.assert_frame_equal(covers_df, full_df)
+
+
+def test_update_covers_df_matches_full_rebuild(data_root):
+    info = {}
+    _assert_same_covers(update_covers_df(data_root, info=info), data_root)
+    assert info['cache'] == 'miss'
+
+    info = {}
+    _assert_same_covers(update_covers_df(data_root, info=info), data_root)
+    assert info['cache'] == 'hit'
+    assert info['parsed_files'] == 0
+
+    # Delete, change, add and touch label files
+    labels_dir = os.path.join(data_root, 'labels')
+    os.remove(os.path.join(labels_dir, 'Abola_2019-03-01.xml'))
+    shutil.copy(os.path.join(labels_dir, 'Record_2019-05-01.xml'),
+                os.path.join(labels_dir, 'Ojogo_2019-05-01.xml'))
+    shutil.copy(os.path.join(labels_dir, 'Record_2019-06-01.xml'),
+                os.path.join(labels_dir, 'Record_2020-01-01.xml'))
+    touched = os.path.join(labels_dir, 'Abola_2019-07-01.xml')
+    os.utime(touched, ns=(0, 0))
+
+    info = {}
+    _assert_same_covers(update_covers_df(data_root, info=info), data_root)
+    assert info['cache'] == 'partial'
+    assert info['parsed_files'] == 2
+    assert info['deleted_files'] == 1
+
+
+def test_cube_counts_of_a_newspaper_without_covers():
+    covers_df = cover_data_to_pandas(DATA_DIR, use_store=False)
+    cube = CoverCube.from_covers_df(
+        covers_df[covers_df['Newspaper'] != 'ojogo'])
+    assert np.array_equal(cube.newspaper_counts('Ojogo'),
+                          np.zeros(len(CHANNELS)))
+    assert np.array_equal(cube.month_of_year_counts('Ojogo'),
+                          np.zeros((12, len(CHANNELS))))
+    assert cube.newspaper_counts('Abola', [2019]).sum() > 0
+
+
+GAMES_CSV = '''away_score,away_team,date,home_score,home_team
+1,Porto,2019-01-01,2,Benfica
+0,Sporting,2019-01-02,0,Braga
+3,Benfica,2019-01-03,1,Porto
+,Porto,2019-01-04,,Sporting
+'''
+
+
+def test_games_data_bounds_and_unplayed_games(tmp_path):
+    path = str(tmp_path / 'games_data.csv')
+    with open(path, 'w') as f:
+        f.write(GAMES_CSV)
+
+    for start, end in ((dt.date(2019, 1, 2), dt.date(2019, 1, 3)),
+                       (pd.Timestamp('2019-01-02'), pd.Timestamp('2019-01-03')),
+                       (dt.datetime(2019, 1, 2, 20), dt.datetime(2019, 1, 3, 1))):
+        games_df = games_data_to_pandas(path, start=start, end=end)
+        assert list(games_df['Date'].dt.day) == [2, 3]
+
+    # The game without a score is not played yet
+    games_df = games_data_to_pandas(path, start=None, end=None)
+    assert list(games_df['Date'].dt.day) == [1, 2, 3]
+    assert games_df['Home_Score'].dtype == np.int16
+    assert list(games_df['Away_Score']) == [1, 0, 3]
+
+
+def test_next_day_does_not_import_the_crawler(data_root):
+    import subprocess
+    import sys
+    from conftest import PACKAGE_DIR
+
+    code = ('import sys, analysis; analysis.main(sys.argv[1:]); '
+            'print(sorted(m for m in ("crawl_covers", "asyncio", "bs4", '
+            '"matplotlib") if m in sys.modules))')
+    output = subprocess.run(
+        [sys.executable, '-c', code, '--data', data_root, 'next-day'],
+        cwd=PACKAGE_DIR,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    assert output.splitlines()[-1] == '[]'
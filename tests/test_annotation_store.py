@@ -0,0 +1,37 @@
+import os
+import shutil
+import numpy as np
+import annotation_store
+from annotation_store import AnnotationStore
+
+
+def test_store_is_recompiled_only_when_a_label_changes(data_root,
+                                                        monkeypatch):
+    compiled = []
+    compile_annotations = annotation_store.compile_annotations
+
+    def counting_compile(*args, **kwargs):
+        compiled.append(args[0])
+        return compile_annotations(*args, **kwargs)
+
+    monkeypatch.setattr(annotation_store, 'compile_annotations',
+                        counting_compile)
+
+    store = AnnotationStore.open(data_root)
+    assert len(compiled) == 1
+    idx = store.names.index('Abola_2019-05-01')
+    old_boxes = np.array(store.target(idx)['boxes'])
+
+    store = AnnotationStore.open(data_root)
+    assert len(compiled) == 1
+
+    labels_dir = os.path.join(data_root, 'labels')
+    shutil.copy(os.path.join(labels_dir, 'Record_2019-05-01.xml'),
+                os.path.join(labels_dir, 'Abola_2019-05-01.xml'))
+    store = AnnotationStore.open(data_root)
+    assert len(compiled) == 2
+    new_boxes = store.target(store.names.index('Abola_2019-05-01'))['boxes']
+    assert not np.array_equal(new_boxes, old_boxes)
+    assert np.array_equal(
+        new_boxes,
+        store.target(store.names.index('Record_2019-05-01'))['boxes'])
@@ -0,0 +1,33 @@
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+from categorical_yearplot import calendar_raster, cyearsplot
+
+
+def test_calendar_raster_stripes():
+    data = pd.Series([0b011, 0b100, 0b000],
+                     index=pd.to_datetime(
+                         ['2019-01-01', '2019-01-02', '2019-01-03']))
+    raster, cell = calendar_raster(data,
+                                   2019,
+                                   colors={0: 'red', 1: 'blue'},
+                                   fillcolor='white')
+    assert cell == 2
+    # 2019-01-01 was a Tuesday, in the first week
+    tuesday = raster[cell:2 * cell, :cell]
+    assert np.array_equal(tuesday[:, 0], [[1, 0, 0, 1]] * cell)
+    assert np.array_equal(tuesday[:, 1], [[0, 0, 1, 1]] * cell)
+    # No label in colors, or no data at all: fillcolor
+    for weekday in (2, 3, 4):
+        day = raster[weekday * cell:(weekday + 1) * cell, :cell]
+        assert np.array_equal(day.reshape(-1, 4), [[1, 1, 1, 1]] * cell**2)
+
+
+def test_cyearsplot_empty_series():
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    empty = pd.Series([], index=pd.DatetimeIndex([]), dtype=np.uint8)
+    assert cyearsplot(empty, colors={0: 'red'}, ax=ax) is ax
+    plt.close(fig)
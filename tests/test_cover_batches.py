@@ -0,0 +1,40 @@
+import pickle
+import numpy as np
+import pytest
+from cover_batches import CoverBatches
+from covers_dataset import CoversDataset
+from synthetic import generate_dataset
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('synthetic'))
+    generate_dataset(root, newspapers=2, years=1, images=True)
+    return CoversDataset(root,
+                         use_store=True,
+                         use_image_store=True,
+                         image_size=(105, 131))
+
+
+def test_stores_are_pickled_by_path(dataset):
+    for store in (dataset.image_store, dataset.store):
+        copy = pickle.loads(pickle.dumps(store))
+        assert copy.store_dir == store.store_dir
+    store_bytes = sum(shard.nbytes for shard in dataset.image_store.shards)
+    assert len(pickle.dumps(dataset)) < store_bytes // 100
+
+    copy = pickle.loads(pickle.dumps(dataset))
+    image, target = copy[7]
+    assert isinstance(image, np.memmap)
+    assert np.array_equal(image, dataset[7][0])
+    assert np.array_equal(target['boxes'], dataset[7][1]['boxes'])
+
+
+def test_process_workers_match_serial_loading(dataset):
+    serial = list(CoverBatches(dataset, batch_size=64, workers=0))
+    in_processes = list(
+        CoverBatches(dataset, batch_size=64, workers=2, use_processes=True))
+    assert len(serial) == len(in_processes)
+    for a, b in zip(serial, in_processes):
+        for key in ('images', 'boxes', 'labels', 'counts'):
+            assert np.array_equal(a[key], b[key])
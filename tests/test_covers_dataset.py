@@ -0,0 +1,17 @@
+import glob
+import os
+import numpy as np
+from covers_dataset import parse_label_files, sort_by_filename
+from conftest import DATA_DIR
+
+
+def test_parallel_parse_matches_serial_parse():
+    label_paths = sort_by_filename(
+        glob.glob(os.path.join(DATA_DIR, 'labels', '*.xml')))
+    serial = parse_label_files(label_paths, workers=1)
+    parallel = parse_label_files(label_paths, workers=2, chunksize=16)
+    assert len(parallel) == len(serial) == len(label_paths)
+    for (labels, boxes, width, height), expected in zip(parallel, serial):
+        assert np.array_equal(labels, expected[0])
+        assert np.array_equal(boxes, expected[1])
+        assert (width, height) == expected[2:]
@@ -0,0 +1,113 @@
+import datetime
+import json
+import os
+import pytest
+from crawl_covers import (AsyncCrawler, CrawlManifest, Newspaper, Resolution,
+                          extract_image_url)
+from crawl_fixtures import FixtureServer, cover_image, cover_page
+
+START = datetime.date(2019, 1, 1)
+END = datetime.date(2019, 1, 3)
+MISSING_DAY = '2019-01-02'
+
+
+HOST = 'example.com'
+
+
+def _cover_url(res, ext='jpeg'):
+    return (f'http://{HOST}/covers/Abola_2019-01-01.{ext}?'
+            f'W={res.width}&H={res.height}')
+
+
+@pytest.mark.parametrize('res', list(Resolution))
+def test_extract_image_url_picks_the_resolution(res):
+    page = cover_page(HOST, Newspaper.Abola, '2019-01-01')
+    assert extract_image_url(page, res) == _cover_url(res)
+    assert extract_image_url(page, res, 'image/webp') == _cover_url(res, 'webp')
+    # As served, with the & of the urls escaped
+    escaped = page.replace('&H=', '&amp;H=')
+    assert '&amp;' in escaped
+    assert extract_image_url(escaped, res) == _cover_url(res)
+
+
+def test_extract_image_url_falls_back_to_the_first_jpeg():
+    page = cover_page(HOST, Newspaper.Abola, '2019-01-01')
+    first_jpeg = _cover_url(Resolution.R1050x1305)
+
+    # Requested resolution not listed
+    missing = page.replace('W=640&H=795', 'W=1&H=1')
+    assert extract_image_url(missing, Resolution.R640x795) == first_jpeg
+
+    # No source states its resolution
+    bare = page
+    for res in Resolution:
+        bare = bare.replace('?' + res.html_str(), '')
+    assert extract_image_url(bare, Resolution.R640x795) == (
+        f'http://{HOST}/covers/Abola_2019-01-01.jpeg')
+
+    assert extract_image_url('<html><body></body></html>',
+                             Resolution.R640x795) is None
+
+
+def _crawler(server):
+    return AsyncCrawler(newspapers=(Newspaper.Abola, Newspaper.Record),
+                        start=START,
+                        end=END,
+                        concurrency=4,
+                        rate=0,
+                        retries=3,
+                        backoff=0,
+                        base_url=server.base_url)
+
+
+def _page_path(newspaper, day):
+    return f'/jornais/desporto/{newspaper.value}/{day}'
+
+
+def test_crawl_retries_and_records_failures(tmp_path):
+    flaky_page = _page_path(Newspaper.Abola, '2019-01-01')
+    with FixtureServer(missing_days=[MISSING_DAY],
+                       fail_first={flaky_page: 2}) as server:
+        results = _crawler(server).crawl(str(tmp_path))
+        requests = list(server.requests)
+
+    errors = {filename: error for filename, _, error in results}
+    assert len(errors) == 6
+    for newspaper in (Newspaper.Abola, Newspaper.Record):
+        assert errors.pop(f'{newspaper.name}_{MISSING_DAY}') is not None
+    assert all(error is None for error in errors.values())
+
+    # The two 503 are retried, the 404 is not
+    assert requests.count(flaky_page) == 3
+    assert requests.count(_page_path(Newspaper.Record, MISSING_DAY)) == 1
+
+    with open(tmp_path / 'Abola_2019-01-01.jpeg', 'rb') as f:
+        assert f.read() == cover_image(Newspaper.Abola, '2019-01-01')
+    assert not os.path.exists(tmp_path / f'Abola_{MISSING_DAY}.jpeg')
+
+    with open(tmp_path / CrawlManifest.FILENAME) as f:
+        manifest = json.load(f)
+    assert manifest['Abola_2019-01-01']['status'] == 'done'
+    assert manifest[f'Record_{MISSING_DAY}']['status'] == 'failed'
+
+
+def test_crawl_resumes_only_the_failed_days(tmp_path):
+    with FixtureServer(missing_days=[MISSING_DAY]) as server:
+        _crawler(server).crawl(str(tmp_path))
+
+    with FixtureServer() as server:
+        results = _crawler(server).crawl(str(tmp_path))
+        requests = list(server.requests)
+
+    assert sorted(filename for filename, _, _ in results) == [
+        f'Abola_{MISSING_DAY}', f'Record_{MISSING_DAY}'
+    ]
+    assert all(error is None for _, _, error in results)
+    pages = [path for path in requests if path.startswith('/jornais/')]
+    assert sorted(pages) == sorted(
+        _page_path(n, MISSING_DAY) for n in (Newspaper.Abola, Newspaper.Record))
+
+    manifest = CrawlManifest(str(tmp_path))
+    assert all(entry['status'] == 'done'
+               for entry in manifest.entries.values())
+    assert len(manifest.entries) == 6
@@ -0,0 +1,40 @@
+import glob
+import os
+import random
+from analysis import cover_data_to_pandas, games_data_to_pandas
+from daily_ingest import DailyAggregates, verify
+from conftest import DATA_DIR
+
+
+def _frames():
+    covers_df = cover_data_to_pandas(DATA_DIR, use_store=False)
+    games_df = games_data_to_pandas(os.path.join(DATA_DIR, 'games_data.csv'))
+    return covers_df, games_df
+
+
+def test_running_statistics_match_full_recompute(tmp_path):
+    covers_df, games_df = _frames()
+    label_paths = sorted(glob.glob(os.path.join(DATA_DIR, 'labels', '*.xml')))
+    random.Random(0).shuffle(label_paths)
+
+    # Covers and games interleaved and out of order, some ingested twice
+    aggregates = DailyAggregates()
+    half = len(games_df) // 2
+    aggregates.add_games_df(games_df.iloc[half:])
+    for label_path in label_paths[:500]:
+        aggregates.add_label_file(label_path)
+    aggregates.add_games_df(games_df.iloc[:half])
+    for label_path in label_paths[400:]:
+        aggregates.add_label_file(label_path)
+    assert verify(aggregates, covers_df, games_df) == []
+
+    state_path = str(tmp_path / 'daily_state.pkl')
+    aggregates.save(state_path)
+    aggregates = DailyAggregates.load(state_path)
+    assert verify(aggregates, covers_df, games_df) == []
+
+    # Removing a cover updates every statistic
+    newspaper, date = covers_df.iloc[10][['Newspaper', 'Date']]
+    aggregates.add_cover(newspaper, date, None)
+    assert verify(aggregates, covers_df, games_df) != []
+    assert verify(aggregates, covers_df.drop(index=10), games_df) == []
@@ -0,0 +1,83 @@
+import glob
+import os
+import shutil
+import numpy as np
+import pytest
+from covers_dataset import CoversDataset
+from dataset_archive import DatasetArchive, pack, unpack
+from synthetic import generate_dataset
+
+
+@pytest.fixture(scope='module')
+def root(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('synthetic'))
+    generate_dataset(root, newspapers=2, years=1, images=True)
+    # A label without cover
+    os.remove(os.path.join(root, 'covers', 'Abola_2019-02-01.jpeg'))
+    return root
+
+
+def _shards(path):
+    return sorted(glob.glob(path + '*'))
+
+
+def test_dataset_reads_the_same_from_the_archive(root, tmp_path):
+    path = str(tmp_path / 'dataset.pack')
+    assert pack(root, path, shards=3) == 730
+
+    folder = CoversDataset(root)
+    archive = CoversDataset(None, archive=path)
+    assert archive.keys == folder.keys
+    assert archive.unpaired_labels == folder.unpaired_labels
+    for idx in (0, 100, len(folder) - 1):
+        (folder_image, folder_target) = folder[idx]
+        (archive_image, archive_target) = archive[idx]
+        assert np.array_equal(np.asarray(folder_image),
+                              np.asarray(archive_image))
+        assert np.array_equal(folder_target['boxes'], archive_target['boxes'])
+        assert np.array_equal(folder_target['labels'],
+                              archive_target['labels'])
+
+    out_dir = str(tmp_path / 'unpacked')
+    assert unpack(path, out_dir) == 730
+    for directory in ('labels', 'covers'):
+        names = sorted(os.listdir(os.path.join(root, directory)))
+        assert sorted(os.listdir(os.path.join(out_dir, directory))) == names
+        for name in names[:20]:
+            with open(os.path.join(root, directory, name), 'rb') as a, open(
+                    os.path.join(out_dir, directory, name), 'rb') as b:
+                assert a.read() == b.read()
+
+
+def test_repacking_removes_the_old_shards(root, tmp_path):
+    path = str(tmp_path / 'dataset.pack')
+    pack(root, path, shards=4)
+    pack(root, path, shards=2)
+    assert _shards(path) == [path + '.00000', path + '.00001']
+    with DatasetArchive.open(path) as archive:
+        assert len(archive) == 730
+        assert len(archive.paths) == 2
+
+    pack(root, path)
+    assert _shards(path) == [path]
+    pack(root, path, shards=2)
+    assert _shards(path) == [path + '.00000', path + '.00001']
+
+
+def test_mixed_shards_are_rejected(root, tmp_path):
+    path = str(tmp_path / 'dataset.pack')
+    pack(root, path, shards=2)
+    shutil.copy(path + '.00001', path + '.00002')
+    with pytest.raises(ValueError):
+        DatasetArchive.open(path)
+
+    # Shards with the right numbers but from packs of different keys
+    smaller = str(tmp_path / 'smaller')
+    shutil.copytree(os.path.join(root, 'labels'),
+                    os.path.join(smaller, 'labels'))
+    for name in ('Abola_2019-01-01', 'Abola_2019-01-02'):
+        os.remove(os.path.join(smaller, 'labels', name + '.xml'))
+    other = str(tmp_path / 'other.pack')
+    pack(smaller, other, shards=2)
+    with pytest.raises(ValueError, match='more than one shard'):
+        DatasetArchive([path + '.00000', other + '.00001'])
@@ -0,0 +1,20 @@
+import os
+import pytest
+from image_store import ImageStore
+from synthetic import generate_dataset
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_decode_errors_name_the_cover(tmp_path, workers):
+    root = str(tmp_path)
+    generate_dataset(root, newspapers=1, years=1, images=True)
+    path = os.path.join(root, 'covers', 'Abola_2019-03-01.jpeg')
+    with open(path, 'rb') as f:
+        content = f.read()
+    with open(path, 'wb') as f:
+        f.write(content[:len(content) // 2])
+
+    with pytest.raises(OSError, match='Abola_2019-03-01.jpeg'):
+        ImageStore.open(root, size=(50, 60), workers=workers)
+    assert not ImageStore.is_fresh(os.path.join(root, 'images_50x60'), None,
+                                   (50, 60))
@@ -0,0 +1,28 @@
+import os
+import pytest
+from analysis import (_next_day_analysis, cover_data_to_pandas,
+                      games_data_to_pandas, tidify_covers_df)
+from next_day import next_day_table
+from conftest import DATA_DIR
+
+
+@pytest.fixture(scope='module')
+def frames():
+    covers_df = cover_data_to_pandas(DATA_DIR, use_store=False)
+    games_df = games_data_to_pandas(os.path.join(DATA_DIR, 'games_data.csv'))
+    return covers_df, games_df
+
+
+def test_next_day_table_matches_next_day_analysis(frames):
+    covers_df, games_df = frames
+    table = next_day_table(covers_df, games_df).set_index(
+        ['Newspaper', 'Club', 'Outcome'])
+    tidy_df = tidify_covers_df(covers_df)
+
+    for newspaper in ('abola', 'record', 'ojogo'):
+        for team in ('Benfica', 'Porto', 'Sporting'):
+            tallies = _next_day_analysis(tidy_df, games_df, newspaper, team)
+            for outcome, prefix in (('win', 'wins'), ('non-win', 'non_wins')):
+                row = table.loc[(newspaper, team.lower(), outcome)]
+                assert row['Events'] == tallies[prefix]
+                assert row['Highlighted'] == tallies['highlighted_' + prefix]
@@ -0,0 +1,35 @@
+import glob
+import os
+import numpy as np
+from annotation_store import flatten_parsed_labels
+from covers_dataset import parse_label_files
+from page_coverage import coverage_metrics, union_area
+from utils import LabelClass
+from conftest import DATA_DIR
+
+
+def test_union_area_counts_overlaps_once():
+    assert union_area(np.zeros((0, 4))) == 0
+    assert union_area([[0, 0, 10, 10], [5, 5, 15, 15]]) == 175
+    assert union_area([[0, 0, 10, 10], [2, 2, 4, 4]]) == 100
+    assert union_area([[0, 0, 1, 1], [2, 0, 3, 1]]) == 2
+
+
+def test_raster_shares_match_exact_union():
+    label_paths = sorted(glob.glob(os.path.join(DATA_DIR, 'labels',
+                                                '*.xml')))[:200]
+    arrays = flatten_parsed_labels(parse_label_files(label_paths))
+    share = coverage_metrics(arrays)['share']
+
+    offsets, sizes = arrays['offsets'], arrays['sizes']
+    errors = []
+    for cover in range(len(label_paths)):
+        start, end = offsets[cover], offsets[cover + 1]
+        page = float(sizes[cover, 0]) * float(sizes[cover, 1])
+        for label in LabelClass:
+            boxes = arrays['boxes'][start:end][arrays['labels'][start:end] ==
+                                               label.id]
+            errors.append(share[cover, label.id] - union_area(boxes) / page)
+    errors = np.abs(errors)
+    assert errors.max() < .03
+    assert errors.mean() < .005
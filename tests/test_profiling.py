@@ -0,0 +1,30 @@
+import numpy as np
+import profiling
+from profiling import Profiler
+
+
+def test_max_rss_units(monkeypatch):
+    monkeypatch.setattr(profiling.sys, 'platform', 'linux')
+    linux = profiling._max_rss_bytes()
+    monkeypatch.setattr(profiling.sys, 'platform', 'darwin')
+    darwin = profiling._max_rss_bytes()
+    assert linux // 1024 - 1 <= darwin <= linux // 1024 + 1024
+
+
+def test_stage_records_and_peak_allocations():
+    profiler = Profiler(trace_memory=True)
+    with profiler.stage('big', rows=1) as info:
+        info['boxes'] = 2
+        np.ones(2**20)
+    with profiler.stage('small'):
+        np.ones(16)
+
+    big, small = profiler.records
+    assert big['rows'] == 1 and big['boxes'] == 2
+    assert big['peak_alloc_bytes'] >= 8 * 2**20 > small['peak_alloc_bytes']
+    assert 'stage peak alloc (MB)' in profiler.summary()
+
+    profiler = Profiler()
+    with profiler.stage('untraced'):
+        pass
+    assert 'peak_alloc_bytes' not in profiler.records[0]
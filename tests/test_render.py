@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pandas as pd
+from analysis import CALENDAR_STYLE, main
+from render import FigureSpec
+from render_cache import RenderCache, figure_key
+
+
+def test_report_renders_every_newspaper_and_year(data_root, tmp_path):
+    out_dir = str(tmp_path / 'report')
+    main(['--data', data_root, '--out-dir', out_dir, 'report'])
+    names = sorted(os.listdir(out_dir))
+    assert names == sorted(
+        [f'{view}_view.png' for view in ('calendar', 'month')] + [
+            f'{view}_{newspaper}_2019.png'
+            for view in ('calendar', 'month')
+            for newspaper in ('abola', 'ojogo', 'record')
+        ])
+
+
+def _covers_df():
+    return pd.DataFrame({
+        'Date': pd.to_datetime(['2019-01-01', '2019-01-02', '2020-01-01']),
+        'Newspaper': ['abola', 'record', 'abola'],
+        'Highlighted_Mask': np.array([1, 2, 4], dtype=np.uint8),
+    })
+
+
+def test_figure_key_follows_the_data_and_style():
+    covers_df = _covers_df()
+    spec = FigureSpec('Abola', 2019, 'calendar', 'a.png')
+    key = figure_key(spec, covers_df, CALENDAR_STYLE)
+
+    assert figure_key(spec._replace(output_path='b/c.png'), covers_df,
+                      CALENDAR_STYLE) == key
+    # Covers not plotted by the spec
+    other = covers_df.copy()
+    other.loc[1:, 'Highlighted_Mask'] = 8
+    assert figure_key(spec, other, CALENDAR_STYLE) == key
+
+    changed = covers_df.copy()
+    changed.loc[0, 'Highlighted_Mask'] = 3
+    assert figure_key(spec, changed, CALENDAR_STYLE) != key
+    style = dict(CALENDAR_STYLE, linewidth=3)
+    assert figure_key(spec, covers_df, style) != key
+    assert figure_key(spec._replace(view='month'), covers_df,
+                      CALENDAR_STYLE) != key
+
+
+def test_render_cache_evicts_the_least_recently_used(tmp_path):
+    figure = tmp_path / 'figure.png'
+    figure.write_bytes(b'x' * 100)
+    cache = RenderCache(str(tmp_path / 'cache'), max_bytes=1000)
+    for i, key in enumerate(('a', 'b', 'c')):
+        cache.put(key, str(figure))
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+
+    out_path = str(tmp_path / 'out.png')
+    assert cache.get('a', out_path)
+    assert open(out_path, 'rb').read() == b'x' * 100
+    assert not cache.get('d', out_path)
+
+    cache.max_bytes = 250
+    cache.evict()
+    assert sorted(os.listdir(cache.cache_dir)) == ['a.png', 'c.png']
+    cache.max_bytes = 100
+    cache.evict()
+    assert sorted(os.listdir(cache.cache_dir)) == ['a.png']
@@ -0,0 +1,27 @@
+import os
+import numpy as np
+from analysis import cover_data_to_pandas, games_data_to_pandas
+from next_day import next_day_table
+from significance import next_day_significance
+from conftest import DATA_DIR
+
+
+def test_rates_match_next_day_table():
+    covers_df = cover_data_to_pandas(DATA_DIR, use_store=False)
+    games_df = games_data_to_pandas(os.path.join(DATA_DIR, 'games_data.csv'))
+    table = next_day_table(covers_df, games_df).set_index(
+        ['Newspaper', 'Club', 'Outcome'])
+    significance = next_day_significance(covers_df,
+                                         games_df,
+                                         n_permutations=200,
+                                         n_bootstrap=200)
+
+    for row in significance.itertuples(index=False):
+        wins = table.loc[(row.Newspaper, row.Club, 'win')]
+        non_wins = table.loc[(row.Newspaper, row.Club, 'non-win')]
+        assert row.Wins == wins['Events']
+        assert row.Non_Wins == non_wins['Events']
+        assert np.isclose(row.Win_Rate, wins['Rate'])
+        assert np.isclose(row.Non_Win_Rate, non_wins['Rate'])
+        assert row.Win_CI_Low <= row.Win_Rate <= row.Win_CI_High
+        assert 0 < row.P_Value <= 1
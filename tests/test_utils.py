@@ -0,0 +1,20 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+from utils import pool_map, to_day
+
+
+def test_to_day_of_every_date_type():
+    expected = np.datetime64('2019-03-01', 'D')
+    for date in ['2019-03-01', dt.date(2019, 3, 1),
+                 dt.datetime(2019, 3, 1, 12), pd.Timestamp('2019-03-01 12:00'),
+                 np.datetime64('2019-03-01T12:00')]:
+        assert to_day(date) == expected
+
+
+def test_pool_map_matches_serial_map():
+    jobs = list(range(10))
+    expected = [abs(-j) for j in jobs]
+    assert pool_map(abs, jobs) == expected
+    assert pool_map(abs, jobs, workers=2, chunksize=3) == expected
+    assert pool_map(abs, [], workers=None) == []